@@ -6,11 +6,25 @@
 Scribble image and create binary mask.
 
 Usage:
-    pyscribble.py
-    pyscribble.py <path-img>
+    pyscribble.py [--profile=<path-json>] [--simplify=<pixels>]
+    pyscribble.py [--profile=<path-json>] [--simplify=<pixels>] <path-img>
+    pyscribble.py render [--processes=<n>] [--runs] <path-scribbles>...
 
 Arguments:
     <path-img>
+    <path-scribbles>    Scribbles saved next to images (*-scribbles.npz),
+                        masks are rendered next to them (*-mask.tif).
+
+Options:
+    --processes=<n>     Number of processes (number of CPUs by default).
+    --runs              Also save masks as runs of pixels (*-mask.npz).
+    --simplify=<pixels>
+                        Tolerance of the simplification of drawn strokes
+                        (0 removes only collinear points) [default: 0].
+    --profile=<path-json>
+                        Time the hot paths, log a summary periodically and
+                        write measures to a JSON file on exit (also enabled
+                        by the environment variable PYSCRIBBLE_PROFILE).
 
 Author: Denis Samuylov
 Date: denis.samuylov@gmail.com
@@ -20,14 +34,29 @@ Last edited: December 2015
 
 import sys
 import docopt
-import PyQt4.QtGui as QtGui
-from pyscribble.main import ControlWindow
 
 if __name__ == '__main__':
     # Parse arguments from command line:
     args = docopt.docopt(__doc__)
+    if args["render"]:
+        # Render masks without GUI:
+        from pyscribble.render import render_files
+        processes = args["--processes"]
+        processes = int(processes) if processes else None
+        render_files(args["<path-scribbles>"], processes,
+                     log=lambda line: sys.stdout.write(line + "\n"),
+                     runs=args["--runs"])
+        sys.exit(0)
     path_img = args["<path-img>"]
+    # Profiling:
+    from pyscribble import instrument
+    if args["--profile"]:
+        instrument.enable(args["--profile"])
+    else:
+        instrument.enable_from_environment()
     # Run:
+    import PyQt4.QtGui as QtGui
+    from pyscribble.main import ControlWindow
     app = QtGui.QApplication(sys.argv)
-    cw = ControlWindow(path_img)
+    cw = ControlWindow(path_img, float(args["--simplify"]))
     sys.exit(app.exec_())
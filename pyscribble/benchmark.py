@@ -0,0 +1,199 @@
+"""benchmark.py
+
+Time the stages of the pipeline (load, project, display, rasterize) on
+synthetic image stacks and scribbles, without GUI. Sizes are comma separated
+lists, every combination is measured. Results are written as JSON.
+
+Usage:
+    benchmark.py [options]
+
+Options:
+    --frames=<n>        Numbers of frames [default: 1,10].
+    --slices=<n>        Numbers of slices [default: 1,10].
+    --size=<n>          Sizes (height = width) of planes [default: 512].
+    --strokes=<n>       Numbers of strokes [default: 10,1000].
+    --points=<n>        Number of points of a stroke [default: 50].
+    --radius=<r>        Radius of the brush of strokes [default: 0].
+    --operators=<op>    Projection operators (mean, max, min, std)
+                        [default: mean,max].
+    --threads=<n>       Number of threads computing projections [default: 1].
+    --dtype=<dtype>     Type of pixels [default: uint16].
+    --compress          Write compressed stacks (read page by page).
+    --repeat=<n>        Number of repetitions of a measure [default: 3].
+    --output=<path>     Path of the JSON file (standard output by default).
+
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import itertools
+import numpy as np
+import tifffile
+
+from .display import DisplayMapper
+from .display import intensity_stats
+from .masks import render_sparse_mask
+from .masks import write_mask
+from .projection import MEAN
+from .projection import project
+from .scribbles import ScribbleStore
+from .stack import open_stack
+
+
+def synthetic_stack(path, shape, dtype=np.uint16, compress=False, seed=0):
+    """Write a random 4D stack (frame, slice, height, width) plane by plane.
+    """
+    rng = np.random.RandomState(seed)
+    info = np.iinfo(dtype) if np.dtype(dtype).kind in "ui" else None
+    high = min(info.max, 4095) if info is not None else 1.
+    nplanes = shape[0]*shape[1]
+
+    def planes():
+        for _ in range(nplanes):
+            yield (rng.random_sample(shape[-2:]) * high).astype(dtype)
+
+    tifffile.imwrite(path, planes(), shape=shape, dtype=dtype,
+                     photometric="minisblack",
+                     compression="zlib" if compress else None)
+
+
+def synthetic_scribbles(shape, nstrokes, npoints, seed=0, radius=0):
+    """Random walk strokes, a tenth of them drawn at all slices."""
+    rng = np.random.RandomState(seed)
+    nslices, h, w = shape
+    scribbles = ScribbleStore()
+    for i in range(nstrokes):
+        start = rng.random_sample(2) * (h, w)
+        steps = rng.normal(0, 3, (npoints, 2))
+        points = np.clip(start + np.cumsum(steps, axis=0), 0, (h - 1, w - 1))
+        if i % 10 == 0:
+            slices = (0, nslices)
+        else:
+            z = rng.randint(nslices)
+            slices = (z, z + 1)
+        scribbles.add(points, slices, radius=radius)
+    return scribbles
+
+
+def measure(func, repeat):
+    """Return durations (s) of calls of a function and its last result."""
+    durations = []
+    for _ in range(repeat):
+        start = time.time()
+        result = func()
+        durations.append(time.time() - start)
+    return durations, result
+
+
+def run_case(folder, nframes, nslices, size, nstrokes, npoints=50,
+             dtype=np.uint16, compress=False, repeat=3, radius=0,
+             operators=(MEAN,), threads=1):
+    """Time all stages for a single combination of sizes."""
+    shape = (nframes, nslices, size, size)
+    path = os.path.join(folder, "stack.tif")
+    synthetic_stack(path, shape, dtype, compress)
+    case = {"frames": nframes, "slices": nslices, "size": size,
+            "strokes": nstrokes, "points": npoints, "radius": radius,
+            "dtype": np.dtype(dtype).name, "compress": compress}
+    results = []
+
+    def record(stage, durations, **extra):
+        res = dict(case, stage=stage, seconds=durations,
+                   best=min(durations), mean=float(np.mean(durations)))
+        res.update(extra)
+        results.append(res)
+
+    # Open the stack and read the first plane (what is displayed first):
+    def read():
+        image = open_stack(path)
+        np.asarray(image[0, 0])
+        return image
+    durations, image = measure(read, repeat)
+    record("read_image", durations)
+
+    # Projections:
+    for operator in operators:
+        for frame, slice_ in [(True, False), (False, True), (True, True)]:
+            durations, _ = measure(
+                lambda: project(image, frame, slice_, operator=operator,
+                                threads=threads), repeat)
+            record("project", durations, project_frame=frame,
+                   project_slice=slice_, operator=operator, threads=threads)
+
+    # Display: statistics once, then conversion of every plane:
+    durations, stats = measure(lambda: intensity_stats(image), repeat)
+    record("intensity_stats", durations)
+    mapper = DisplayMapper(stats.vmin, stats.vmax, image.dtype)
+    out = np.empty((size, size), np.uint8)
+
+    def display():
+        for f in range(nframes):
+            for z in range(nslices):
+                mapper(np.asarray(image[f, z]), out)
+    durations, _ = measure(display, repeat)
+    record("display", [d / (nframes*nslices) for d in durations],
+           per="plane")
+
+    # Rasterization of scribbles into a mask and writing it:
+    scribbles = synthetic_scribbles(shape[1:], nstrokes, npoints,
+                                    radius=radius)
+    durations, mask = measure(
+        lambda: render_sparse_mask(scribbles, shape[1:]), repeat)
+    record("rasterize", durations)
+    path_mask = os.path.join(folder, "mask.tif")
+    durations, _ = measure(lambda: write_mask(path_mask, mask), repeat)
+    record("write_mask", durations)
+
+    if hasattr(image, "close"):
+        image.close()
+    del image
+    return results
+
+
+def run(frames, slices, sizes, strokes, npoints=50, dtype=np.uint16,
+        compress=False, repeat=3, radius=0, operators=(MEAN,), threads=1):
+    """Time all stages for every combination of sizes."""
+    folder = tempfile.mkdtemp()
+    results = []
+    try:
+        for nframes, nslices, size, nstrokes in itertools.product(
+                frames, slices, sizes, strokes):
+            results += run_case(folder, nframes, nslices, size, nstrokes,
+                                npoints, dtype, compress, repeat, radius,
+                                operators, threads)
+    finally:
+        shutil.rmtree(folder)
+    return {"python": platform.python_version(),
+            "numpy": np.__version__,
+            "tifffile": tifffile.__version__,
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": results}
+
+
+def main(argv=None):
+    import docopt
+    args = docopt.docopt(__doc__, argv)
+
+    def sizes(key):
+        return [int(n) for n in args[key].split(",")]
+
+    report = run(sizes("--frames"), sizes("--slices"), sizes("--size"),
+                 sizes("--strokes"), int(args["--points"]),
+                 np.dtype(args["--dtype"]), args["--compress"],
+                 int(args["--repeat"]), float(args["--radius"]),
+                 args["--operators"].split(","), int(args["--threads"]))
+    if args["--output"] is None:
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        with open(args["--output"], "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Image and mask processing independent of the GUI.
+
+Reading stacks, projecting and normalizing them for display and rasterizing
+scribbles into masks only need numpy: this module (and the modules it
+gathers) never imports Qt, and tifffile is imported by the functions
+reading or writing files, so headless scripts start quickly and run on
+machines without a display.
+
+"""
+
+import os
+import numpy as np
+
+from .instrument import timed
+from .jobs import Cancelled
+from .masks import write_mask
+from .stack import open_stack
+
+# Processing steps for scripts (e.g. `from pyscribble.core import project`):
+from .display import DisplayMapper
+from .display import intensity_stats
+from .display import normalize
+from .masks import LiveMask
+from .masks import render_mask
+from .masks import render_sparse_mask
+from .projection import ProjectionCache
+from .projection import project
+from .raster import rasterize_scribbles
+from .raster import segment_cells
+from .raster import stroke_pixels
+from .stack import count_channels
+
+
+def read_image(path, channel=0):
+    """Open a channel of an image as a 4D array (frame, slice, height, width).
+
+    The data keep their native dtype and are read lazily, only the planes
+    that are accessed are loaded into memory.
+
+    """
+    return open_stack(path, channel)
+
+
+@timed("save_mask")
+def save_mask_file(path, mask, progress=None):
+    """Write a mask (masks.LiveMask), remove the partial file if cancelled.
+    """
+    try:
+        write_mask(path, mask.sparse(), progress=progress)
+    except Cancelled:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+
+def pixel_centers_2d(min_height, max_height, min_width, max_width):
+    """Generate coordinates of pixel centers in image space in 2d bounding box.
+
+    Note: the whole box is enumerated, raster.segment_cells returns only the
+    pixels crossed by segments (same rule as line_pass_square).
+
+    """
+    nh = abs(max_height - min_height) + 1
+    nw = abs(max_width - min_width) + 1
+    v, u = np.meshgrid(np.linspace(min_height, max_height, nh),
+                       np.linspace(min_width, max_width, nw),
+                       indexing='ij')
+    # Note: v = height, u = width
+    px_centers = np.vstack([v.ravel(), u.ravel()]).T
+    return px_centers
+
+
+def line_pass_two_points_2d(p1, p2):
+    """Return (C, B, A) of a line Cy + Bx + A = 0 passing through p1 and p2.
+    """
+    ys, xs = p1[-2:]
+    ye, xe = p2[-2:]
+    return [xe - xs, ys - ye, ye*xs - ys*xe]
+
+
+def line_pass_square(c, p):
+    """Test if a line Cy + Bx + A = 0 pass through a unit square.
+
+    c: coordinates of the center (y, x).
+    p: parameters defining a line (C, B, A).
+
+    """
+    c = np.array(c, np.float64)
+    p = np.array(p, np.float64)
+    vertices = [c + [0.5, 0.5], c + [-0.5, 0.5],
+                c + [-0.5, -0.5], c + [0.5, -0.5]]
+    res = np.int16([np.sign(np.dot(list(v) + [1], p)) for v in vertices])
+    # At least two vertices have to be on different sides of the line:
+    if -1 in res and 1 in res:
+        return True
+    return False
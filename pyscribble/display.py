@@ -0,0 +1,178 @@
+"""Intensity statistics of images and their conversion to 8 bit for display.
+
+Statistics are computed once, streaming over the planes of an image. Planes
+are then mapped to uint8 with a lookup table (8 and 16 bit unsigned images)
+or a single in-place pass over a reusable buffer (other dtypes). Mapped
+planes of several channels are blended into a composite RGB plane.
+
+"""
+
+import threading
+import numpy as np
+
+from .projection import CHUNK_SIZE
+from .projection import iter_chunks
+
+# Number of histogram bins for images that are not 8/16 bit unsigned:
+NBINS = 1024
+# Colors (r, g, b) of channels in composites:
+CHANNEL_COLORS = [(0, 255, 0), (255, 0, 255), (0, 255, 255), (255, 0, 0),
+                  (0, 0, 255), (255, 255, 0)]
+
+
+def normalize(image, vmin, vmax):
+    if vmax == vmin:
+        return np.zeros(np.shape(image), np.uint8)
+    return np.uint8(255*(np.float64(image) - vmin)/(vmax - vmin))
+
+
+def has_lut(dtype):
+    """Test if images of a given dtype can be displayed with a lookup table."""
+    dtype = np.dtype(dtype)
+    return dtype.kind == "u" and dtype.itemsize <= 2
+
+
+class IntensityStats(object):
+    """Global and per-frame minimum and maximum with a global histogram.
+
+    hist[i] counts values in [edges[i], edges[i + 1]).
+
+    """
+
+    def __init__(self, frame_min, frame_max, hist, edges, integer):
+        self.frame_min = frame_min
+        self.frame_max = frame_max
+        self.vmin = frame_min.min()
+        self.vmax = frame_max.max()
+        self.hist = hist
+        self.edges = edges
+        self.integer = integer
+        self._cumsum = np.cumsum(hist)
+
+    def limits(self, low=0., high=100.):
+        """Return intensities (vmin, vmax) at given percentiles."""
+        total = self._cumsum[-1]
+        if low <= 0 or total == 0:
+            vmin = self.vmin
+        else:
+            i = np.searchsorted(self._cumsum, low/100.*total, side="right")
+            vmin = self.edges[i]
+        if high >= 100 or total == 0:
+            vmax = self.vmax
+        else:
+            i = np.searchsorted(self._cumsum, high/100.*total, side="left")
+            # Integer bins hold a single value:
+            vmax = self.edges[i] if self.integer else self.edges[i + 1]
+        vmin = min(max(vmin, self.vmin), self.vmax)
+        vmax = min(max(vmax, vmin), self.vmax)
+        return vmin, vmax
+
+
+def intensity_stats(image, nbins=NBINS, frames=None, progress=None):
+    """Compute intensity statistics of a 4D image reading chunks of planes.
+
+    Values of 8/16 bit unsigned images are counted exactly in a single pass,
+    images of other types are read twice (limits, then histogram).
+
+    frames: frames to read (all by default), e.g. [0] for a first estimate.
+    progress: function called with the fraction of the work done after
+              every chunk (see jobs.Job).
+
+    """
+    if frames is None:
+        frames = range(image.shape[0])
+    frames = list(frames)
+    # Frame -> position in per-frame statistics:
+    position = dict((f, i) for i, f in enumerate(frames))
+    frame_min = np.zeros(len(frames), image.dtype)
+    frame_max = np.zeros(len(frames), image.dtype)
+    integer = has_lut(image.dtype)
+    # Number of chunks to read:
+    nchunks = len(frames) * len(range(0, image.shape[1], CHUNK_SIZE))
+    nchunks *= 1 if integer else 2
+    done = 0
+    hist = 0
+    for f, zs, block in iter_chunks(image, frames=frames):
+        f = position[f]
+        vmin, vmax = block.min(), block.max()
+        if zs.start == 0:
+            frame_min[f], frame_max[f] = vmin, vmax
+        else:
+            frame_min[f] = min(frame_min[f], vmin)
+            frame_max[f] = max(frame_max[f], vmax)
+        if integer:
+            hist = hist + np.bincount(block.ravel(),
+                                      minlength=2**(8*image.dtype.itemsize))
+        done += 1
+        if progress is not None:
+            progress(float(done) / nchunks)
+    if integer:
+        edges = np.arange(len(hist) + 1)
+    else:
+        vrange = (frame_min.min(), frame_max.max())
+        edges = np.histogram_bin_edges([], nbins, vrange)
+        for f, zs, block in iter_chunks(image, frames=frames):
+            hist = hist + np.histogram(block, edges)[0]
+            done += 1
+            if progress is not None:
+                progress(float(done) / nchunks)
+    return IntensityStats(frame_min, frame_max, hist, edges, integer)
+
+
+class DisplayMapper(object):
+    """Convert planes to uint8 for display with fixed intensity limits."""
+
+    def __init__(self, vmin, vmax, dtype):
+        self.vmin = vmin
+        self.vmax = vmax
+        self.lut = None
+        if has_lut(dtype):
+            values = np.arange(2**(8*np.dtype(dtype).itemsize))
+            self.lut = normalize(np.clip(values, vmin, vmax), vmin, vmax)
+        # Work buffers for the conversion without lookup table (planes may
+        # be converted in several threads):
+        self._local = threading.local()
+
+    def __call__(self, plane, out=None):
+        if out is None:
+            out = np.empty(plane.shape, np.uint8)
+        if self.lut is not None:
+            return np.take(self.lut, plane, out=out)
+        buf = getattr(self._local, "buffer", None)
+        if buf is None or buf.shape != plane.shape:
+            buf = self._local.buffer = np.empty(plane.shape, np.float64)
+        scale = 255./(self.vmax - self.vmin) if self.vmax > self.vmin else 0.
+        np.subtract(plane, self.vmin, out=buf)
+        buf *= scale
+        np.clip(buf, 0, 255, out=buf)
+        out[...] = buf
+        return out
+
+
+def composite(planes, colors=None, out=None):
+    """Blend uint8 planes of channels into a plane of packed RGB colors.
+
+    colors: colors (r, g, b) of channels (CHANNEL_COLORS by default).
+    out: uint32 array to write the plane to.
+
+    Returns a uint32 plane of 0xffRRGGBB values (QImage.Format_RGB32).
+
+    """
+    if colors is None:
+        colors = [CHANNEL_COLORS[i % len(CHANNEL_COLORS)]
+                  for i in range(len(planes))]
+    rgb = np.zeros((3,) + planes[0].shape, np.uint32)
+    for plane, color in zip(planes, colors):
+        for i, c in enumerate(color):
+            if c == 255:
+                rgb[i] += plane
+            elif c > 0:
+                rgb[i] += plane.astype(np.uint32) * c // 255
+    np.minimum(rgb, 255, out=rgb)
+    if out is None:
+        out = np.empty(planes[0].shape, np.uint32)
+    out[...] = 0xff000000
+    out |= rgb[0] << 16
+    out |= rgb[1] << 8
+    out |= rgb[2]
+    return out
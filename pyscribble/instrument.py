@@ -0,0 +1,141 @@
+"""Opt-in timing of the hot paths of the application.
+
+Profiling is enabled by the environment variable PYSCRIBBLE_PROFILE set to
+the path of a JSON file (or by `enable`). Durations of calls of functions
+decorated with `timed` are then collected into histograms, values set with
+`RECORDER.gauge` (e.g. number of scene items) are kept, a summary is logged
+periodically and everything is dumped to the JSON file on exit.
+
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import functools
+import threading
+
+ENV_PROFILE = "PYSCRIBBLE_PROFILE"
+ENV_INTERVAL = "PYSCRIBBLE_PROFILE_INTERVAL"
+# Default period (s) of the log:
+LOG_INTERVAL = 10.
+# Upper bounds (s) of the bins of latency histograms (last bin unbounded):
+LATENCY_BINS = [1e-4 * 2**k for k in range(16)]
+
+
+class LatencyHistogram(object):
+    """Number of calls, total and maximum duration, durations by bin."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+        self.bins = [0] * (len(LATENCY_BINS) + 1)
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        i = 0
+        while i < len(LATENCY_BINS) and duration > LATENCY_BINS[i]:
+            i += 1
+        self.bins[i] += 1
+
+    def as_dict(self):
+        return {"count": self.count, "total": self.total, "max": self.max,
+                "mean": self.total / self.count if self.count else 0.,
+                "bins": self.bins, "bin_upper_bounds": LATENCY_BINS}
+
+
+class Recorder(object):
+    """Latency histograms of timed calls and last values of gauges."""
+
+    def __init__(self):
+        self.enabled = False
+        self.latencies = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, duration):
+        with self._lock:
+            if name not in self.latencies:
+                self.latencies[name] = LatencyHistogram()
+            self.latencies[name].add(duration)
+
+    def gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def report(self):
+        with self._lock:
+            return {"latencies": dict((name, hist.as_dict()) for name, hist
+                                      in self.latencies.items()),
+                    "gauges": dict(self.gauges)}
+
+    def summary(self):
+        """Return lines of text summarizing the measures."""
+        report = self.report()
+        lines = []
+        for name in sorted(report["latencies"]):
+            hist = report["latencies"][name]
+            lines.append("{}: {} calls, mean {:.1f} ms, max {:.1f} ms".format(
+                name, hist["count"], 1e3*hist["mean"], 1e3*hist["max"]))
+        for name in sorted(report["gauges"]):
+            lines.append("{}: {}".format(name, report["gauges"][name]))
+        return lines
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+
+RECORDER = Recorder()
+
+
+def timed(name):
+    """Decorator recording durations of calls when profiling is enabled."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not RECORDER.enabled:
+                return func(*args, **kwargs)
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                RECORDER.add(name, time.time() - start)
+        return wrapper
+    return decorator
+
+
+def log_periodically(interval, log):
+    """Log the summary every `interval` seconds from a daemon thread."""
+    def run():
+        while True:
+            time.sleep(interval)
+            for line in RECORDER.summary():
+                log(line)
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def enable(path, interval=LOG_INTERVAL):
+    """Enable profiling, log to stderr and dump to a JSON file on exit."""
+    if RECORDER.enabled:
+        return
+    RECORDER.enabled = True
+    atexit.register(RECORDER.dump, path)
+    if interval > 0:
+        log_periodically(interval,
+                         lambda line: sys.stderr.write(line + "\n"))
+
+
+def enable_from_environment():
+    """Enable profiling if requested by environment variables."""
+    path = os.environ.get(ENV_PROFILE)
+    if path:
+        enable(path, float(os.environ.get(ENV_INTERVAL, LOG_INTERVAL)))
+    return RECORDER.enabled
@@ -0,0 +1,127 @@
+"""Long operations (loading, saving) run in background threads.
+
+A job calls a function with a callback to report its progress (fraction of
+the work done). Once the job is cancelled the callback raises Cancelled, so
+the function stops at its next report. Jobs never call back into the GUI:
+the GUI polls their progress and collects their result.
+
+"""
+
+import threading
+
+
+class Cancelled(Exception):
+    """Raised in a job that has been cancelled."""
+
+
+class Job(object):
+    """Run `func(progress)` in a thread and keep its result or error."""
+
+    def __init__(self, func, name=None):
+        self.func = func
+        self.name = name
+        self.progress = 0.
+        self.result = None
+        self.error = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self.result = self.func(self.update)
+        except Cancelled:
+            pass
+        except Exception as e:
+            self.error = e
+        finally:
+            self._done.set()
+
+    def update(self, fraction):
+        """Report progress (called by the function of the job)."""
+        if self._cancel.is_set():
+            raise Cancelled()
+        self.progress = min(max(fraction, 0.), 1.)
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Wait for the end of the job, return whether it has ended."""
+        self._done.wait(timeout)
+        return self._done.is_set()
+
+
+class JobQueue(object):
+    """Jobs run one at a time, in the order they are submitted.
+
+    The GUI polls the queue: `poll` collects the job that has ended (its
+    result is handled by the caller) and starts the next one.
+
+    """
+
+    def __init__(self):
+        # Running job and function called with its result:
+        self.job = None
+        self.done = None
+        # Jobs waiting for the running one (function, name, done):
+        self._waiting = []
+
+    def __len__(self):
+        return len(self._waiting) + (self.job is not None)
+
+    def submit(self, func, name=None, done=None):
+        """Run `func(progress)` once previous jobs have ended.
+
+        done: function called with the result (see `poll`).
+
+        """
+        self._waiting.append((func, name, done))
+        if self.job is None:
+            self._next()
+
+    def _next(self):
+        if self._waiting:
+            func, name, self.done = self._waiting.pop(0)
+            self.job = Job(func, name)
+
+    def poll(self):
+        """Return the job that has ended and its `done` function (or None),
+        the next job is started."""
+        job, done = self.job, self.done
+        if job is None or not job.done():
+            return None
+        self.job = None
+        self.done = None
+        self._next()
+        return job, done
+
+    def cancel(self):
+        """Cancel the running job (the next one starts once it has ended)."""
+        if self.job is not None:
+            self.job.cancel()
+
+    def clear(self):
+        """Drop waiting jobs, cancel the running one and wait for its end."""
+        self._waiting = []
+        job = self.job
+        self.job = None
+        self.done = None
+        if job is not None:
+            job.cancel()
+            job.wait()
+
+    def wait(self):
+        """Run all jobs to their end (results are not handled)."""
+        while self.job is not None:
+            self.job.wait()
+            self.poll()
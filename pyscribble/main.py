@@ -1,8 +1,39 @@
 import os
-import tifffile
+import math
+import collections
 import numpy as np
 import PyQt4.QtGui as QtGui
 import PyQt4.QtCore as QtCore
+import sip
+
+from .core import line_pass_square
+from .core import line_pass_two_points_2d
+from .core import pixel_centers_2d
+from .core import segment_cells
+from .core import read_image
+from .core import save_mask_file
+from .display import DisplayMapper
+from .display import composite
+from .display import intensity_stats
+from .instrument import RECORDER
+from .instrument import timed
+from .jobs import JobQueue
+from .masks import LiveMask
+from .prefetch import PlanePrefetcher
+from .projection import MEAN
+from .projection import OPERATORS
+from .projection import ProjectionCache
+from .render import MASK_SUFFIX
+from .scribbles import DEFAULT_LABEL
+from .scribbles import ScribbleStore
+from .scribbles import StrokeInput
+from .scribbles import derived_path
+from .scribbles import load_scribbles
+from .scribbles import save_scribbles
+from .scribbles import scribbles_path
+from .stack import count_channels
+from .tiles import TilePyramid
+from .tiles import reuse_buffer
 
 # Scale of the image to draw:
 SCALE = "scale"
@@ -10,38 +41,171 @@ SCALE = "scale"
 # Image dimensions:
 SLICE = "slice"
 FRAME = "frame"
-DIMENSION_LABELS = [FRAME, SLICE]
-# CHANNEL = "channel"
-# DIMENSION_LABELS = [FRAME, SLICE, CHANNEL]
+CHANNEL = "channel"
+DIMENSION_LABELS = [FRAME, SLICE, CHANNEL]
 
 # Color map to display the image:
 COLORTABLE = [QtGui.qRgb(i, i, i) for i in range(256)]
 
+# Number of threads computing a projection:
+PROJECTION_THREADS = 2
+
+# Number of tiles of the displayed image kept as pixel maps:
+TILE_CACHE_SIZE = 256
+
+# Maximal radius (pixels) of the brush:
+MAX_BRUSH_RADIUS = 100
+# Largest label of strokes (uint16 masks):
+MAX_LABEL = 65535
+# Opacity of the inside of filled scribbles and of the mask overlay:
+FILL_ALPHA = 64
+MASK_ALPHA = 96
+
+# Tolerance (pixels) of the simplification of drawn strokes (0 removes only
+# collinear points and keeps the mask unchanged, None disables it):
+SIMPLIFY_TOLERANCE = 0.
+MAX_SIMPLIFY_TOLERANCE = 10.
+
+# Names of background jobs (shown with their progress):
+LOAD_JOB = "Loading"
+STATS_JOB = "Statistics"
+SAVE_JOB = "Saving"
+# Period (ms) of updates of the progress of background jobs:
+JOB_POLL_INTERVAL = 100
+
+# Period (ms) of updates of the profiling overlay:
+PROFILE_OVERLAY_INTERVAL = 1000
+
+
+def label_color(label, alpha=255):
+    """Color of a label (labels 1-255 have distinct hues, default is red)."""
+    # Labels above 255 reuse the colors of 1-255 (see GraphicsView.draw_mask):
+    label = (label - 1) % 255 + 1
+    hue = ((label - DEFAULT_LABEL) * 0.618034) % 1.
+    return QtGui.QColor.fromHsvF(hue, 1., 1., alpha / 255.)
+
+
+def wrap_image(data, format):
+    """Wrap an aligned 2D array (see tiles.aligned_buffer) into a QImage.
+
+    Nothing is copied: the array must live as long as the image.
+
+    """
+    h, w = data.shape
+    return QtGui.QImage(sip.voidptr(data.ctypes.data), w, h, data.strides[0],
+                        format)
+
+
+def read_first_frame(path, progress=None):
+    """Open the first channel of an image and read its first frame.
+
+    Returns the number of channels, the channel (see core.read_image) and
+    intensity statistics of its first frame (see display.intensity_stats).
+
+    progress: see jobs.Job.
+
+    """
+    nchannels = count_channels(path)
+    image = read_image(path)
+    return nchannels, image, intensity_stats(image, frames=[0],
+                                             progress=progress)
+
+
+# Color map of the overlay of the mask (transparent where not scribbled):
+MASK_COLORTABLE = [QtGui.qRgba(0, 0, 0, 0)] + \
+    [label_color(label, MASK_ALPHA).rgba() for label in range(1, 256)]
+
+
+class ChannelData(object):
+    """Image of a channel with its projections and display planes."""
+
+    def __init__(self, image):
+        self.image = image
+        self.image_projected = None
+        # Projection of the image being displayed (see
+        # ControlWindow.projection_key):
+        self.key = None
+        # Projections of the image computed so far:
+        self.projections = ProjectionCache(image, threads=PROJECTION_THREADS)
+        # Intensity statistics of the projections (projection -> stats):
+        self.stats = {}
+        self.display_mapper = None
+        # Display planes prepared ahead of the current view:
+        self.prefetcher = PlanePrefetcher()
+
+    def close(self):
+        # Stop computing projections and release the file:
+        self.prefetcher.close()
+        self.projections.close()
+        if hasattr(self.image, "close"):
+            self.image.close()
+
+
+def channel_attribute(name):
+    """Property reading an attribute of the displayed channel's data."""
+    return property(lambda self: getattr(self.channel, name, None))
+
 
 class ControlWindow(QtGui.QWidget):
 
-    def __init__(self, path_image=None):
+    # Data of the displayed channel (see ChannelData):
+    image = channel_attribute("image")
+    image_projected = channel_attribute("image_projected")
+    projections = channel_attribute("projections")
+    stats = channel_attribute("stats")
+    display_mapper = channel_attribute("display_mapper")
+    prefetcher = channel_attribute("prefetcher")
+
+    def __init__(self, path_image=None, simplify_tolerance=SIMPLIFY_TOLERANCE):
         super(ControlWindow, self).__init__()
         self.path_image = path_image
 
         self.image_is_loaded = False
-        self.image = None
-        self.image_projected = None
+        # Channels of the image opened so far (channel -> ChannelData):
+        self.channels = {}
+        self.nchannels = 0
+        # Percentage of pixels saturated at each end of the intensity range:
+        self.saturation = 0.
+        # Operator of projections (mean, max, min, std):
+        self.operator = MEAN
+        # Tolerance of the simplification of drawn strokes:
+        self.simplify_tolerance = simplify_tolerance
+        # Radius of the brush (pixels) and whether strokes are filled lassos:
+        self.brush_radius = 0
+        self.fill = False
+        # Label of drawn strokes:
+        self.label = DEFAULT_LABEL
 
         self.image_window = None
 
+        # Background jobs: loading (first frame, then statistics of all
+        # frames) and saving run side by side, a save never waits for the
+        # image to be loaded:
+        self.load_jobs = JobQueue()
+        self.save_jobs = JobQueue()
+        self.job_timer = None
+
         # Objects we will initialize from the scene
         self.selected_pixels = None
         self.polygon_collection = None
 
-        self.view = {SLICE: 0, FRAME: 0, SCALE: 1}
-        self.project = {SLICE: False, FRAME: False}
-        # self.view = {CHANNEL: 0, SLICE: 0, FRAME: 0, SCALE: 1}
-        # self.project = {CHANNEL: False, SLICE: False, FRAME: False}
+        self.view = {CHANNEL: 0, SLICE: 0, FRAME: 0, SCALE: 1}
+        # (a projection of channels is their composite)
+        self.project = {CHANNEL: False, SLICE: False, FRAME: False}
 
         # Shared GUI elements:
         self.sliders_widget = None
         self.mask_name_line = None
+        self.saturation_box = None
+        self.radius_box = None
+        self.fill_checkbox = None
+        self.simplify_box = None
+        self.label_box = None
+        self.open_button = None
+        self.open_series_button = None
+        self.save_button = None
+        self.progress_bar = None
+        self.cancel_button = None
         self.sliders = {}
         self.projection_checkboxes = {}
 
@@ -60,8 +224,10 @@ class ControlWindow(QtGui.QWidget):
         self.setWindowTitle('pyscribble')
 
         # Open image
-        open_button = QtGui.QPushButton("Open image")
-        open_button.clicked.connect(self.open_image)
+        self.open_button = QtGui.QPushButton("Open image")
+        self.open_button.clicked.connect(self.open_image)
+        self.open_series_button = QtGui.QPushButton("Open folder")
+        self.open_series_button.clicked.connect(self.open_series)
 
         # Zoom-in
         zoom_in_button = QtGui.QPushButton('   +   ')
@@ -74,26 +240,97 @@ class ControlWindow(QtGui.QWidget):
         # Widget panel
         self.sliders_widget = QtGui.QFrame()
 
+        # Contrast
+        saturation_label = QtGui.QLabel("Saturated %")
+        self.saturation_box = QtGui.QDoubleSpinBox()
+        self.saturation_box.setRange(0., 49.)
+        self.saturation_box.setSingleStep(0.1)
+        self.saturation_box.setValue(self.saturation)
+        self.saturation_box.valueChanged.connect(self.update_saturation)
+
+        # Projection operator
+        operator_label = QtGui.QLabel("Projection")
+        self.operator_box = QtGui.QComboBox()
+        self.operator_box.addItems(OPERATORS)
+        self.operator_box.setCurrentIndex(OPERATORS.index(self.operator))
+        self.operator_box.currentIndexChanged.connect(self.update_operator)
+
+        # Brush
+        radius_label = QtGui.QLabel("Brush radius")
+        self.radius_box = QtGui.QSpinBox()
+        self.radius_box.setRange(0, MAX_BRUSH_RADIUS)
+        self.radius_box.setValue(self.brush_radius)
+        self.radius_box.valueChanged.connect(self.update_brush)
+        self.fill_checkbox = QtGui.QCheckBox("Fill (lasso)")
+        self.fill_checkbox.setChecked(self.fill)
+        self.fill_checkbox.stateChanged.connect(self.update_brush)
+        simplify_label = QtGui.QLabel("Simplify (px)")
+        self.simplify_box = QtGui.QDoubleSpinBox()
+        self.simplify_box.setRange(0., MAX_SIMPLIFY_TOLERANCE)
+        self.simplify_box.setSingleStep(0.5)
+        # (None, no simplification, is shown as 0)
+        self.simplify_box.setValue(self.simplify_tolerance or 0.)
+        self.simplify_box.valueChanged.connect(self.update_simplify)
+
+        # Label
+        label_label = QtGui.QLabel("Label")
+        self.label_box = QtGui.QSpinBox()
+        self.label_box.setRange(1, MAX_LABEL)
+        self.label_box.setValue(self.label)
+        self.label_box.valueChanged.connect(self.update_label)
+
         # Display output mask name
         self.mask_name_line = QtGui.QLineEdit(self)
 
+        # Undo and redo strokes
+        undo_button = QtGui.QPushButton("Undo")
+        undo_button.clicked.connect(self.undo)
+        redo_button = QtGui.QPushButton("Redo")
+        redo_button.clicked.connect(self.redo)
+
         # Reset mask
         reset_button = QtGui.QPushButton("Reset")
         reset_button.clicked.connect(self.reset_mask)
 
         # Save button
-        save_button = QtGui.QPushButton("Save")
-        save_button.clicked.connect(self.save_mask)
+        self.save_button = QtGui.QPushButton("Save")
+        self.save_button.clicked.connect(self.save_mask)
+
+        # Progress of background jobs:
+        self.progress_bar = QtGui.QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.hide()
+        self.cancel_button = QtGui.QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel_job)
+        self.cancel_button.hide()
+        self.job_timer = QtCore.QTimer(self)
+        self.job_timer.timeout.connect(self.poll_jobs)
 
         # Set layout:
         layout = QtGui.QGridLayout()
-        layout.addWidget(open_button, 0, 0, 1, 2)
+        layout.addWidget(self.open_button, 0, 0)
+        layout.addWidget(self.open_series_button, 0, 1)
         layout.addWidget(zoom_out_button, 1, 0)
         layout.addWidget(zoom_in_button, 1, 1)
         layout.addWidget(self.sliders_widget, 2, 0, 1, 2)
-        layout.addWidget(self.mask_name_line, 3, 0, 1, 2)
-        layout.addWidget(reset_button, 4, 0)
-        layout.addWidget(save_button, 4, 1)
+        layout.addWidget(saturation_label, 3, 0)
+        layout.addWidget(self.saturation_box, 3, 1)
+        layout.addWidget(operator_label, 4, 0)
+        layout.addWidget(self.operator_box, 4, 1)
+        layout.addWidget(radius_label, 5, 0)
+        layout.addWidget(self.radius_box, 5, 1)
+        layout.addWidget(self.fill_checkbox, 6, 0, 1, 2)
+        layout.addWidget(simplify_label, 7, 0)
+        layout.addWidget(self.simplify_box, 7, 1)
+        layout.addWidget(label_label, 8, 0)
+        layout.addWidget(self.label_box, 8, 1)
+        layout.addWidget(self.mask_name_line, 9, 0, 1, 2)
+        layout.addWidget(undo_button, 10, 0)
+        layout.addWidget(redo_button, 10, 1)
+        layout.addWidget(reset_button, 11, 0)
+        layout.addWidget(self.save_button, 11, 1)
+        layout.addWidget(self.progress_bar, 12, 0)
+        layout.addWidget(self.cancel_button, 12, 1)
         self.setLayout(layout)
 
         self.setGeometry(100, 100, 200, 400)
@@ -102,6 +339,9 @@ class ControlWindow(QtGui.QWidget):
     def closeEvent(self, event):
         if self.image_window is not None:
             self.image_window.close()
+        # Finish writing the masks being saved:
+        self.load_jobs.clear()
+        self.save_jobs.wait()
         super(ControlWindow, self).closeEvent(event)
 
     def mousePressEvent(self, QMouseEvent):
@@ -110,28 +350,49 @@ class ControlWindow(QtGui.QWidget):
             self.image_window.activateWindow()
         self.activateWindow()
 
+    @property
+    def channel(self):
+        """Data of the displayed channel (None if no image is loaded)."""
+        return self.channels.get(self.view[CHANNEL])
+
     def reset_image_data(self):
+        # Stop loading (a mask being saved does not depend on the image):
+        self.load_jobs.clear()
+        self.show_job()
         if self.image_window is not None:
-            self.image_window.close()
+            # Keep scribbles to resume later:
+            self.store_scribbles()
+            image_window = self.image_window
             self.image_window = None
+            image_window.close()
+        for channel in self.channels.values():
+            channel.close()
         # Reset view and projection:
         self.path_image = None
 
         self.image_is_loaded = False
-        self.image = None
-        self.image_projected = None
+        self.channels = {}
+        self.nchannels = 0
 
-        self.view = {SLICE: 0, FRAME: 0, SCALE: 1}
-        self.project = {SLICE: False, FRAME: False}
+        self.view = {CHANNEL: 0, SLICE: 0, FRAME: 0, SCALE: 1}
+        self.project = {CHANNEL: False, SLICE: False, FRAME: False}
         self.update_default_mask_name()
 
     def load_image(self, path):
-        if self.image_window is not None:
-            self.reset_image_data()
-        # Load image
+        """Open an image in the background, show it once its first frame is
+        read (see `show_image`)."""
+        self.reset_image_data()
         self.path_image = path
-        self.image = read_image(path)
+        self.start_job(self.load_jobs, lambda progress: read_first_frame(
+            path, progress), LOAD_JOB, self.show_image)
+
+    @timed("show_image")
+    def show_image(self, loaded):
+        """Display the image read by `read_first_frame`."""
+        self.nchannels, image, stats = loaded
         self.image_is_loaded = True
+        # Other channels are opened when displayed:
+        self.open_channel(0, image, stats)
         self.update_projected_image()
         # Update GUI elements
         image_window = ImageWindow(self)
@@ -139,6 +400,139 @@ class ControlWindow(QtGui.QWidget):
         self.update_slider_widget()
         self.image_window.update_image_to_display()
         self.update_default_mask_name()
+        self.restore_scribbles()
+
+    def open_channel(self, c, image=None, stats=None):
+        """Open a channel of the image, only its displayed planes are read.
+
+        image, stats: channel and intensity statistics of its first frame,
+                      if already read.
+
+        """
+        if image is None:
+            image = read_image(self.path_image, c)
+            stats = intensity_stats(image, frames=[0])
+        channel = ChannelData(image)
+        self.channels[c] = channel
+        # Display the first frame with its own intensity statistics:
+        channel.stats[(False, False)] = stats
+        # Compute the projection of the whole stack (a single plane) in the
+        # background, others when they are displayed:
+        channel.projections.prefetch([(True, True, self.operator)])
+        if image.shape[0] > 1:
+            # Statistics of all frames are streamed in behind:
+            self.start_job(
+                self.load_jobs,
+                lambda progress: intensity_stats(image, progress=progress),
+                STATS_JOB, lambda stats: self.set_image_stats(c, stats))
+        return channel
+
+    def projection_key(self):
+        """Return the key of the displayed projection (see ProjectionCache).
+
+        The image itself (not projected, or projected over a single frame or
+        slice) is (False, False) for any operator.
+
+        """
+        # (channels have the shape of the first one, always opened)
+        nframes, nslices = self.channels[0].image.shape[:2]
+        frame = self.project[FRAME] and nframes > 1
+        slice_ = self.project[SLICE] and nslices > 1
+        if not (frame or slice_):
+            return (False, False)
+        return (frame, slice_, self.operator)
+
+    def displayed_channels(self):
+        """Return data of displayed channels, ready for the current view."""
+        key = self.projection_key()
+        if self.project[CHANNEL]:
+            indices = range(self.nchannels)
+        else:
+            indices = [self.view[CHANNEL]]
+        channels = []
+        for c in indices:
+            channel = self.channels.get(c)
+            if channel is None:
+                channel = self.open_channel(c)
+            if channel.key != key:
+                self.update_projected_image(channel)
+            channels.append(channel)
+        return channels
+
+    def set_image_stats(self, c, stats):
+        """Replace intensity statistics of the (not projected) channel."""
+        channel = self.channels[c]
+        channel.stats[(False, False)] = stats
+        if channel.key == (False, False):
+            self.update_display_mapper(channel)
+            self.image_window.update_image_to_display()
+
+    def start_job(self, queue, func, name, done=None):
+        """Run `func(progress)` in the background and show its progress.
+
+        queue: jobs.JobQueue of the job (jobs of a queue run in order).
+        done: function called with the result (not if cancelled or failed).
+
+        """
+        queue.submit(func, name, done)
+        self.show_job()
+        self.job_timer.start(JOB_POLL_INTERVAL)
+
+    def displayed_job(self):
+        """Return the job shown with its progress (loading first)."""
+        return self.load_jobs.job or self.save_jobs.job
+
+    def show_job(self):
+        job = self.displayed_job()
+        if job is None:
+            self.progress_bar.hide()
+            self.cancel_button.hide()
+            return
+        self.progress_bar.setFormat(job.name + " %p%")
+        self.progress_bar.setValue(int(100*job.progress))
+        self.progress_bar.show()
+        self.cancel_button.show()
+
+    def poll_jobs(self):
+        for queue in [self.load_jobs, self.save_jobs]:
+            ended = queue.poll()
+            if ended is None:
+                continue
+            job, done = ended
+            if job.error is not None:
+                QtGui.QMessageBox.critical(self, "pyscribble", "{} failed: {}"
+                                           .format(job.name, job.error))
+            elif not job.cancelled and done is not None:
+                done(job.result)
+        self.show_job()
+        if self.displayed_job() is None:
+            self.job_timer.stop()
+
+    def cancel_job(self):
+        """Cancel the displayed job (the next one starts)."""
+        # Note: the job ends at its next progress report.
+        job = self.displayed_job()
+        if job is not None:
+            job.cancel()
+
+    def store_scribbles(self):
+        """Save scribbles next to the image."""
+        path = scribbles_path(self.path_image)
+        scribbles = self.image_window.view.scribbles
+        # Note: no file for an image that has never been scribbled.
+        if len(scribbles) > 0 or os.path.exists(path):
+            save_scribbles(path, scribbles, self.image.shape[1:])
+
+    def restore_scribbles(self):
+        """Load scribbles saved next to the image (if any)."""
+        path = scribbles_path(self.path_image)
+        if not os.path.exists(path):
+            return
+        scribbles, shape = load_scribbles(path)
+        if shape != tuple(self.image.shape[1:]):
+            # Scribbles of another image with the same name:
+            return
+        self.image_window.view.set_scribbles(scribbles)
 
     def update_view(self):
         # Read data from sliders into views:
@@ -162,12 +556,15 @@ class ControlWindow(QtGui.QWidget):
                 layout.itemAt(i).widget().setParent(None)
                 # Note: widget is deleted when its parent is deleted.
 
+        self.sliders = {}
+        self.projection_checkboxes = {}
         if self.image is not None:
             # For each image dimension add slider:
-            shape = self.image.shape
-            for dim in range(len(self.image.shape) - 2):
+            sizes = [self.image.shape[0], self.image.shape[1]]
+            if self.nchannels > 1:
+                sizes.append(self.nchannels)
+            for dim, n in enumerate(sizes):
                 lbl = DIMENSION_LABELS[dim]
-                n = shape[dim]
                 # --> add label:
                 label = QtGui.QLabel(lbl)
                 layout.addWidget(label, dim, 1)
@@ -192,10 +589,7 @@ class ControlWindow(QtGui.QWidget):
         mask_name = None
         if self.image is not None:
             # Generate default mask name
-            folder_name = os.path.dirname(self.path_image)
-            image_id = os.path.basename(self.path_image).split(".")[0]
-            mask_name = os.path.join(folder_name,
-                                     "{}-mask.tif".format(image_id))
+            mask_name = derived_path(self.path_image, MASK_SUFFIX)
 
         if mask_name is not None:
             self.mask_name_line.setText(mask_name)
@@ -203,9 +597,9 @@ class ControlWindow(QtGui.QWidget):
             self.mask_name_line.setText("")
 
     def update_project_checkbox(self):
-        self.project[SLICE] = not self.projection_checkboxes[SLICE].isChecked()
-        self.project[FRAME] = not self.projection_checkboxes[FRAME].isChecked()
-        self.update_projected_image()
+        for lbl, check in self.projection_checkboxes.items():
+            self.project[lbl] = not check.isChecked()
+        self.displayed_channels()
         # update max values for sliders
         shape = self.image_projected.shape
 
@@ -219,15 +613,53 @@ class ControlWindow(QtGui.QWidget):
 
         self.image_window.update_image_to_display()
 
-    def update_projected_image(self):
-        tmp = np.array(self.image)
-        if self.project[FRAME]:
-            tmp = np.mean(tmp, axis=0)
-            tmp = np.expand_dims(tmp, 0)
-        if self.project[SLICE]:
-            tmp = np.mean(tmp, axis=1)
-            tmp = np.expand_dims(tmp, 1)
-        self.image_projected = tmp
+    @timed("update_projected_image")
+    def update_projected_image(self, channel=None):
+        """Project a channel (the displayed one by default) for display."""
+        if channel is None:
+            channel = self.channel
+        channel.key = self.projection_key()
+        channel.image_projected = channel.projections.get(channel.key)
+        self.update_display_mapper(channel)
+
+    def update_display_mapper(self, channel=None):
+        """Set intensity limits to display the projected image."""
+        if channel is None:
+            channel = self.channel
+        key = channel.key
+        if key not in channel.stats:
+            channel.stats[key] = intensity_stats(channel.image_projected)
+        vmin, vmax = channel.stats[key].limits(self.saturation,
+                                               100. - self.saturation)
+        channel.display_mapper = DisplayMapper(vmin, vmax,
+                                               channel.image_projected.dtype)
+        channel.prefetcher.set_source(channel.image_projected,
+                                      channel.display_mapper)
+
+    def update_operator(self):
+        self.operator = OPERATORS[self.operator_box.currentIndex()]
+        if self.image_is_loaded:
+            # (projections with the operator are computed when displayed)
+            self.image_window.update_image_to_display()
+
+    def update_saturation(self):
+        self.saturation = self.saturation_box.value()
+        if self.image_is_loaded:
+            for channel in self.channels.values():
+                if channel.key is not None:
+                    self.update_display_mapper(channel)
+            self.image_window.update_image_to_display()
+
+    def update_brush(self):
+        self.brush_radius = self.radius_box.value()
+        self.fill = self.fill_checkbox.isChecked()
+
+    def update_simplify(self):
+        # Note: strokes already drawn are not simplified again.
+        self.simplify_tolerance = self.simplify_box.value()
+
+    def update_label(self):
+        self.label = self.label_box.value()
 
     def add_image_window(self, widget):
         widget.set_control_window(self)
@@ -249,51 +681,45 @@ class ControlWindow(QtGui.QWidget):
             "Images (*.tif)"))
         self.load_image(path)
 
+    def open_series(self):
+        """Open TIFF files of a folder as a single image (see stack.py)."""
+        path = str(QtGui.QFileDialog.getExistingDirectory(
+            self,
+            "Select a folder of images.",
+            os.path.expanduser("~")))
+        self.load_image(path)
+
     def reset_mask(self):
         self.image_window.reset_scribbles()
 
+    def undo(self):
+        if self.image_is_loaded:
+            self.image_window.view.undo()
+
+    def redo(self):
+        if self.image_is_loaded:
+            self.image_window.view.redo()
+
+    # Note: declared as a slot without arguments for the "Save" button.
+    @QtCore.pyqtSlot()
     def save_mask(self):
-        # Pixel centers:
-        nslices, nheight, nwidth = self.image.shape[-3:]
-
-        # Initialize mask
-        mask = np.zeros(self.image.shape[1:], np.uint8)
-        mask_value = 255
-        for scribble in self.image_window.view.scribbles:
-            # Check that all pixel positions fit the boundary:
-            pts = filter(lambda x: (0 <= x[0]) and (x[0] < nslices) and
-                                   (0 <= x[1]) and (x[1] < nheight) and
-                                   (0 <= x[2]) and (x[2] < nwidth),
-                         scribble)
-            # TODO: do filtering letter, otherwise, boundary segment goes away
-            pts = np.int32(pts)
-
-            # Select pixels overlapped by a line segment between two points:
-            for ps, pe in zip(pts[1:], pts[:-1]):
-                # Coordinates of start- and end- points of the line segment
-                zs, ys, xs = ps
-                ze, ye, xe = pe
-                assert zs == ze
-                # Parameters defining line segment:
-                param = line_pass_two_points_2d(ps, pe)
-                # Bounding box of the segment:
-                pixel_centers = pixel_centers_2d(ys, ye, xs, xe)
-
-                if len(pixel_centers) == 1:
-                    mask[zs, ys, xs] = mask_value
-                    continue
-
-                for px in pixel_centers:
-                    pass_ = line_pass_square(px, param)
-                    if pass_:
-                        y_, x_ = px
-                        mask[zs, y_, x_] = mask_value
-        tifffile.imsave(str(self.mask_name_line.text()), mask)
+        if not self.image_is_loaded:
+            return
+        path = str(self.mask_name_line.text())
+        # Pixels overlapped by line segments of all scribbles (as displayed),
+        # a snapshot since scribbling goes on while the mask is written:
+        mask = self.image_window.view.mask.copy()
+        self.store_scribbles()
+        self.start_job(self.save_jobs,
+                       lambda progress: save_mask_file(path, mask, progress),
+                       SAVE_JOB)
 
     def define_shortcuts(self):
         QtGui.QShortcut(QtGui.QKeySequence("Ctrl+D"), self, self.close)
         QtGui.QShortcut(QtGui.QKeySequence("Ctrl+="), self, self.zoom_in)
         QtGui.QShortcut(QtGui.QKeySequence("Ctrl+-"), self, self.zoom_out)
+        QtGui.QShortcut(QtGui.QKeySequence("Ctrl+Z"), self, self.undo)
+        QtGui.QShortcut(QtGui.QKeySequence("Ctrl+Shift+Z"), self, self.redo)
 
 
 class GraphicsView(QtGui.QGraphicsView):
@@ -305,33 +731,90 @@ class GraphicsView(QtGui.QGraphicsView):
         # Where we start drawing:
         self.dragging = None
         # Store scribbles:
-        self.scribbles = []  # y, x
-        self.current_scribble = None
-        # Define pens:
-        self.red_pen = QtGui.QPen(QtGui.QColor("red"), 3)
+        self.scribbles = ScribbleStore()
+        self.current_scribble = None  # StrokeInput
+        # Scene items of stored scribbles (stroke id -> item) in image space:
+        self.scribble_items = {}
+        self.visible_ids = set()
+        # Path and scene item of the scribble being drawn (image space):
+        self.current_path = None
+        self.current_item = None
+        # Mask of stored scribbles (masks.LiveMask) and its overlay item:
+        self.mask = None
+        self.mask_item = None
+        # Buffer of the displayed plane of the mask and its slice (see
+        # mask_slice):
+        self.mask_plane = None
+        self.mask_plane_slice = None
+        # Scene items and mask pixels of strokes removed by undo or erased
+        # (stroke id -> (item, pixels)), reused if they are restored:
+        self.removed = {}
+        # Whether an update of the current item is scheduled:
+        self.update_pending = False
+        # Last pixel (y, x) of the cursor while erasing (right button):
+        self.erase_point = None
 
     def mousePressEvent(self, event):
+        if event.button() == QtCore.Qt.RightButton:
+            if self.current_scribble is None:
+                self.erase_point = self.cursor_pixel(event)
+                self.erase_to(self.erase_point)
+            return
         self.dragging = True
         # Initialize a scribble (only in 2D):
-        self.current_scribble = []
+        shape = self.control_window.image.shape
+        self.current_scribble = StrokeInput(shape)
         # Note: we add slice information when we register release event.
 
+        # Start a path item that grows while drawing:
+        self.current_path = QtGui.QPainterPath()
+        self.current_item = self.scene().addPath(self.current_path)
+        self.set_item_style(self.current_item,
+                            self.control_window.brush_radius,
+                            self.control_window.fill,
+                            self.control_window.label)
         # Register clicked point:
-        qp = QtCore.QPointF(event.pos())
-        y, x = self.qp2px(qp)
-        # Update current scribble:
-        self.current_scribble.append((y, x))
-        self.draw_current_scribble()
+        self.add_current_point(event)
 
     def mouseMoveEvent(self, event):
+        if self.erase_point is not None:
+            self.erase_to(self.cursor_pixel(event))
+            return
+        if self.current_scribble is None:
+            return
         # Register clicked point:
-        qp = QtCore.QPointF(event.pos())
-        y, x = self.qp2px(qp)
-        # Update current scribble:
-        self.current_scribble.append((y, x))
-        self.draw_current_scribble()
+        if not self.add_current_point(event):
+            return
+        # Update the item once for all moves received before the next repaint:
+        if not self.update_pending:
+            self.update_pending = True
+            QtCore.QTimer.singleShot(0, self.draw_current_scribble)
+
+    def add_current_point(self, event):
+        """Add point of a mouse event to the current scribble and its path.
+
+        Returns False if the point is dropped (same pixel as the previous
+        point or outside of the image).
+
+        """
+        y, x = self.qp2px(self.mapToScene(event.pos()))
+        point = self.current_scribble.add(y, x)
+        if point is None:
+            return False
+        # Note: points are snapped to pixel centers.
+        qp = self.px2qp(point)
+        if self.current_path.elementCount() == 0:
+            self.current_path.moveTo(qp)
+        else:
+            self.current_path.lineTo(qp)
+        return True
 
     def mouseReleaseEvent(self, event):
+        if event.button() == QtCore.Qt.RightButton:
+            self.erase_point = None
+            return
+        if self.current_scribble is None:
+            return
         self.dragging = False
         # Save the scribble we have drawn:
         self.register_current_scribble()
@@ -343,52 +826,326 @@ class GraphicsView(QtGui.QGraphicsView):
         if self.control_window.project[SLICE]:
             # -> at all slices:
             nslices = self.control_window.image.shape[-3]
-            [self.scribbles.append([(z,) + p for p in self.current_scribble])
-                for z in np.arange(nslices)]
+            slices = (0, nslices)
         else:
             # -> at a current slice:
-            z = self.control_window.view["slice"]
-            self.scribbles.append([(z,) + p for p in self.current_scribble])
+            z = self.control_window.view[SLICE]
+            slices = (z, z + 1)
+        frame = self.control_window.view[FRAME]
+        points = self.current_scribble.finish(
+            self.control_window.simplify_tolerance)
+        if len(points) == 0:
+            # Nothing drawn inside of the image:
+            self.scene().removeItem(self.current_item)
+            self.current_path = None
+            self.current_item = None
+            return
+        stroke_id = self.scribbles.add(points, slices, frame,
+                                       self.control_window.brush_radius,
+                                       self.control_window.fill,
+                                       self.control_window.label)
+        # Rasterize only the new stroke into the mask:
+        index = self.mask.add(stroke_id, self.scribbles.strokes[stroke_id])
+        self.prune_removed()
+        # The item of the drawn path becomes the item of the scribble:
+        if (len(points) != self.current_path.elementCount() or
+                self.control_window.fill):
+            # (simplified or closed)
+            self.current_path = self.scribble_path(stroke_id)
+        self.draw_current_scribble()
+        self.scribble_items[stroke_id] = self.current_item
+        self.current_path = None
+        self.current_item = None
+        self.draw_scribbles()
+        self.update_mask(index, self.mask.pixels[stroke_id][1])
+
+    def cursor_pixel(self, event):
+        """Return the pixel (y, x) of the image under the cursor (clipped)."""
+        y, x = self.qp2px(self.mapToScene(event.pos()))
+        h, w = self.mask.shape[-2:]
+        return (min(max(int(math.floor(y)), 0), h - 1),
+                min(max(int(math.floor(x)), 0), w - 1))
+
+    def erase_to(self, point):
+        """Erase strokes crossed by the cursor moving to a pixel (y, x)."""
+        cells, _ = segment_cells([[self.erase_point, point]])
+        self.erase_point = point
+        if self.control_window.project[SLICE]:
+            # Strokes at any slice:
+            z, stroke_ids = None, None
+        else:
+            # Only strokes of the slice are tested:
+            z = self.control_window.view[SLICE]
+            stroke_ids = self.scribbles.at_slice(z)
+        w = self.mask.shape[-1]
+        hits = self.mask.strokes_at(cells[:, 0]*w + cells[:, 1], z,
+                                    stroke_ids)
+        for stroke_id in hits:
+            stroke = self.scribbles.remove(stroke_id)
+            self.apply_change((stroke_id, stroke, False))
+        if hits:
+            self.prune_removed()
+
+    def prune_removed(self):
+        """Drop removed strokes that cannot come back (their changes have
+        been discarded from the history by a new change)."""
+        history = self.scribbles.history_ids()
+        for stroke_id in list(self.removed):
+            if stroke_id not in history:
+                del self.removed[stroke_id]
 
     def qp2px(self, qp):
-        """Convert clicked position to selected pixel."""
-        return tuple([c/self.control_window.view["scale"]
-                      for c in [qp.y(), qp.x()]])
+        """Convert a position in the scene to image coordinates (y, x)."""
+        # Note: the scene is in image space, zoom is a transform of the view.
+        return (qp.y(), qp.x())
 
     def px2qp(self, px):
-        """Convert clicked position to selected pixel."""
-        scale = self.control_window.view["scale"]
-        return QtCore.QPoint(px[1]*scale, px[0]*scale)
+        """Convert image coordinates (y, x) to a position in the scene."""
+        return QtCore.QPointF(px[1], px[0])
 
     def draw_current_scribble(self):
-        if self.current_scribble is not None:
-            polygon = QtGui.QPolygonF()
-            [polygon.append(self.px2qp(p)) for p in self.current_scribble]
-
-            path = QtGui.QPainterPath()
-            path.addPolygon(polygon)
-            self.scene().addPath(path, self.red_pen)
-
+        """Update the item of the scribble being drawn."""
+        self.update_pending = False
+        if self.current_item is not None:
+            self.current_item.setPath(self.current_path)
+
+    def scribble_path(self, stroke_id):
+        stroke = self.scribbles.strokes[stroke_id]
+        polygon = QtGui.QPolygonF()
+        [polygon.append(self.px2qp(p)) for p in stroke.points]
+
+        path = QtGui.QPainterPath()
+        path.addPolygon(polygon)
+        if stroke.fill:
+            path.closeSubpath()
+        return path
+
+    def set_item_style(self, item, radius, fill, label):
+        """Draw an item with the brush radius and color of its scribble."""
+        if radius > 0:
+            # Width of the brush in image space:
+            pen = QtGui.QPen(label_color(label), 2*radius + 1)
+            pen.setCapStyle(QtCore.Qt.RoundCap)
+            pen.setJoinStyle(QtCore.Qt.RoundJoin)
+        else:
+            pen = QtGui.QPen(label_color(label), 3)
+            # (keep the same width at any scale)
+            pen.setCosmetic(True)
+        item.setPen(pen)
+        if fill:
+            item.setBrush(QtGui.QBrush(label_color(label, FILL_ALPHA)))
+
+    def add_scribble_item(self, stroke_id):
+        """Create a (hidden) scene item of a stored scribble."""
+        stroke = self.scribbles.strokes[stroke_id]
+        item = self.scene().addPath(self.scribble_path(stroke_id))
+        self.set_item_style(item, stroke.radius, stroke.fill, stroke.label)
+        item.hide()
+        self.scribble_items[stroke_id] = item
+
+    @timed("draw_scribbles")
     def draw_scribbles(self):
-        # Draw all traces that are already stored:
-        for scribble in self.scribbles:
-
-            # Draw scribbles only at a current slice:
-            # TODO: do it more efficiently by storing scribbles for each frame
-            if self.control_window.project[SLICE]:
-                # Draw scribbles for all slices:
-                pass
+        """Show scribbles at a current slice and hide the others."""
+        if self.control_window.project[SLICE]:
+            # Draw scribbles for all slices:
+            ids = set(self.scribble_items)
+        else:
+            # Draw scribbles only for current slice:
+            ids = self.scribbles.at_slice(self.control_window.view[SLICE])
+        for stroke_id in self.visible_ids - ids:
+            self.scribble_items[stroke_id].hide()
+        for stroke_id in ids - self.visible_ids:
+            self.scribble_items[stroke_id].show()
+        self.visible_ids = set(ids)
+        if RECORDER.enabled:
+            RECORDER.gauge("scene_items", len(self.scene().items()))
+            RECORDER.gauge("visible_scribbles", len(self.visible_ids))
+
+    def mask_slice(self):
+        """Return the slice of the displayed mask (None for all slices)."""
+        if self.control_window.project[SLICE]:
+            return None
+        return self.control_window.view[SLICE]
+
+    @timed("draw_mask")
+    def draw_mask(self):
+        """Show the mask at a current slice as a semi-transparent overlay."""
+        z = self.mask_plane_slice = self.mask_slice()
+        h, w = self.mask.shape[-2:]
+        plane = self.mask_plane = reuse_buffer(self.mask_plane, (h, w))
+        if self.mask.dtype == np.uint8:
+            self.mask.plane(z, out=plane)
+        else:
+            # Labels above 255 are shown with the colors of 1-255:
+            labels = self.mask.plane(z)
+            plane[...] = np.where(labels > 0, (labels - 1) % 255 + 1, 0)
+        qimg = wrap_image(plane, QtGui.QImage.Format_Indexed8)
+        qimg.setColorTable(MASK_COLORTABLE)
+        self.mask_item.setPixmap(QtGui.QPixmap.fromImage(qimg))
+
+    def show_mask_slice(self):
+        """Draw the mask if the displayed slice (or projection) has changed.
+        """
+        if (self.mask_plane is None or
+                self.mask_plane_slice != self.mask_slice()):
+            self.draw_mask()
+
+    @timed("update_mask")
+    def update_mask(self, index, slices):
+        """Redraw pixels of the overlay covered by an added/removed stroke.
+
+        index: flat indices of the pixels of the stroke in a plane.
+        slices: slices (start, stop) of the stroke.
+
+        Only these pixels are looked up in the strokes (the last one covering
+        a pixel gives its label) and only their bounding box is painted.
+
+        """
+        z = self.mask_slice()
+        plane = self.mask_plane
+        if (plane is None or plane.shape != self.mask.shape[-2:] or
+                z != self.mask_plane_slice):
+            self.draw_mask()
+            return
+        if len(index) == 0 or z is not None and not \
+                slices[0] <= z < slices[1]:
+            return
+        labels = self.mask.labels_at(index, z)
+        if labels.dtype != np.uint8:
+            labels = np.where(labels > 0, (labels - 1) % 255 + 1, 0)
+        plane.flat[index] = labels
+        w = plane.shape[1]
+        y0, y1 = index[0] // w, index[-1] // w + 1
+        x = index % w
+        # (rows of the wrapped part start at multiples of 4 bytes)
+        x0, x1 = x.min() // 4 * 4, x.max() + 1
+        qimg = wrap_image(plane[y0:y1, x0:x1], QtGui.QImage.Format_Indexed8)
+        qimg.setColorTable(MASK_COLORTABLE)
+        # Paint into the pixel map of the item (released first, so that it
+        # is not copied):
+        pixmap = self.mask_item.pixmap()
+        self.mask_item.setPixmap(QtGui.QPixmap())
+        painter = QtGui.QPainter(pixmap)
+        painter.setCompositionMode(QtGui.QPainter.CompositionMode_Source)
+        painter.drawImage(x0, y0, qimg)
+        painter.end()
+        self.mask_item.setPixmap(pixmap)
+
+    def undo(self):
+        self.apply_change(self.scribbles.undo(), reverse=True)
+
+    def redo(self):
+        self.apply_change(self.scribbles.redo())
+
+    def apply_change(self, change, reverse=False):
+        """Update items and mask after a stroke is added or removed.
+
+        change: change of the stored scribbles (see ScribbleStore), None for
+                no change.
+
+        Only the item and the pixels of the stroke are added or removed, and
+        only these pixels of the overlay are redrawn.
+
+        """
+        if change is None:
+            return
+        stroke_id, stroke, added = change
+        if added != reverse:
+            item, pixels = self.removed.pop(stroke_id, (None, None))
+            if item is None:
+                self.add_scribble_item(stroke_id)
+                self.mask.add(stroke_id, stroke)
             else:
-                # Draw scribbles only for current slice:
-                z = self.control_window.view[SLICE]
-                scribble = filter(lambda p: p[0] == z, scribble)
+                self.scene().addItem(item)
+                item.hide()
+                self.scribble_items[stroke_id] = item
+                self.mask.restore(stroke_id, pixels)
+            pixels = self.mask.pixels[stroke_id]
+        else:
+            item = self.scribble_items.pop(stroke_id)
+            self.scene().removeItem(item)
+            self.visible_ids.discard(stroke_id)
+            pixels = self.mask.remove(stroke_id)
+            self.removed[stroke_id] = (item, pixels)
+        self.draw_scribbles()
+        self.update_mask(pixels[0], pixels[1])
+
+    def clear_scribbles(self):
+        self.set_scribbles(ScribbleStore())
+
+    def set_scribbles(self, scribbles):
+        """Replace stored scribbles and their items."""
+        for item in self.scribble_items.values():
+            self.scene().removeItem(item)
+        self.scribbles = scribbles
+        self.scribble_items = {}
+        self.visible_ids = set()
+        self.removed = {}
+        for stroke_id in scribbles:
+            self.add_scribble_item(stroke_id)
+        self.mask = LiveMask.from_scribbles(
+            scribbles, self.control_window.image.shape[1:])
+        self.draw_scribbles()
+        self.draw_mask()
+
+
+class TiledPixmapItem(QtGui.QGraphicsItem):
+    """Item displaying a uint8 plane as tiles of a multi-resolution pyramid.
+
+    Only tiles intersecting the exposed region are converted to pixel maps,
+    at the resolution needed for the current zoom.
 
-            polygon = QtGui.QPolygonF()
-            [polygon.append(self.px2qp(p[1:])) for p in scribble]
+    """
 
-            path = QtGui.QPainterPath()
-            path.addPolygon(polygon)
-            self.scene().addPath(path, self.red_pen)
+    def __init__(self, parent=None):
+        super(TiledPixmapItem, self).__init__(parent)
+        self.setFlag(QtGui.QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.pyramid = None
+        # Pixel maps of tiles ((level, ty, tx) -> QPixmap):
+        self.tiles = collections.OrderedDict()
+
+    def set_plane(self, plane):
+        self.prepareGeometryChange()
+        self.pyramid = TilePyramid(plane)
+        self.tiles.clear()
+        self.update()
+
+    def boundingRect(self):
+        if self.pyramid is None:
+            return QtCore.QRectF()
+        h, w = self.pyramid.plane.shape
+        return QtCore.QRectF(0, 0, w, h)
+
+    def tile_pixmap(self, key):
+        if key in self.tiles:
+            # Mark as recently used:
+            pix_map = self.tiles.pop(key)
+        else:
+            data = self.pyramid.tile(*key)
+            if data.dtype == np.uint32:
+                # (composite of channels)
+                qimg = wrap_image(data, QtGui.QImage.Format_RGB32)
+            else:
+                qimg = wrap_image(data, QtGui.QImage.Format_Indexed8)
+                qimg.setColorTable(COLORTABLE)
+            pix_map = QtGui.QPixmap.fromImage(qimg)
+            if len(self.tiles) >= TILE_CACHE_SIZE:
+                self.tiles.popitem(last=False)
+        self.tiles[key] = pix_map
+        return pix_map
+
+    def paint(self, painter, option, widget=None):
+        if self.pyramid is None:
+            return
+        scale = option.levelOfDetailFromTransform(painter.worldTransform())
+        level = self.pyramid.level(scale)
+        rect = option.exposedRect
+        for ty, tx in self.pyramid.visible_tiles(
+                level, rect.top(), rect.left(), rect.bottom(), rect.right()):
+            y0, x0, y1, x1 = self.pyramid.tile_rect(level, ty, tx)
+            pix_map = self.tile_pixmap((level, ty, tx))
+            painter.drawPixmap(QtCore.QRectF(x0, y0, x1 - x0, y1 - y0),
+                               pix_map, QtCore.QRectF(pix_map.rect()))
 
 
 class ImageWindow(QtGui.QWidget):
@@ -399,11 +1156,17 @@ class ImageWindow(QtGui.QWidget):
 
         # Keep reference to control window to have access to view state & data:
         self.control_window = control_window
-        # An image to display is stored in the format of QtGui.QImage:
+        # An image to display is stored as a uint8 plane (uint32 colors for
+        # composites of channels), in a buffer allocated once per shape:
         self.image_to_display = None
         # GUI elements:
         self.scene = None
+        self.image_item = None
+        self.mask_item = None
         self.view = None
+        # Profiling overlay (shown when profiling is enabled):
+        self.profile_item = None
+        self.profile_timer = None
         # Add shortcuts:
         self.define_shortcuts()
         self.initUI()
@@ -422,12 +1185,34 @@ class ImageWindow(QtGui.QWidget):
 
         # Set scene:
         self.scene = QtGui.QGraphicsScene()
+        # (the mask overlay is drawn above the image, scribbles above both)
+        self.image_item = TiledPixmapItem()
+        self.scene.addItem(self.image_item)
+        self.mask_item = QtGui.QGraphicsPixmapItem()
+        self.scene.addItem(self.mask_item)
+        self.profile_item = QtGui.QGraphicsSimpleTextItem()
+        self.profile_item.setBrush(QtGui.QColor("yellow"))
+        self.profile_item.setZValue(1)
+        # (same size at any zoom)
+        self.profile_item.setFlag(
+            QtGui.QGraphicsItem.ItemIgnoresTransformations)
+        self.profile_item.setVisible(RECORDER.enabled)
+        self.scene.addItem(self.profile_item)
+        if RECORDER.enabled:
+            self.profile_timer = QtCore.QTimer(self)
+            self.profile_timer.timeout.connect(self.update_profile_overlay)
+            self.profile_timer.start(PROFILE_OVERLAY_INTERVAL)
         # Set view:
         self.view = GraphicsView(self.scene)
         # TODO: pass reference to the control window with constructor.
         self.view.control_window = self.control_window
+        self.view.mask_item = self.mask_item
+        # Start with an empty mask:
+        self.view.clear_scribbles()
         self.view.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
         self.view.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
+        # Display pixels as squares when zoomed in:
+        self.view.setRenderHint(QtGui.QPainter.SmoothPixmapTransform, False)
 
         # Add image to the scene and display it:
         self.update_image_to_display()
@@ -448,36 +1233,40 @@ class ImageWindow(QtGui.QWidget):
     def set_control_window(self, control_window):
         self.control_window = control_window
 
+    @timed("update_image_to_display")
     def update_image_to_display(self):
-        """Read image data from control_window and convert them to Qt format"""
-        # Get image we would like to display and its dimensions:
-        img = self.control_window.image_projected
-        _, _, h, w = img.shape
+        """Read image data from control_window and display them"""
         # Get current slice to display:
         frame = self.control_window.view["frame"]
         z = self.control_window.view["slice"]
-        # Normalize and convert to Qt format:
-        nimg = normalize(img[frame, z], img.min(), img.max()).T
-        qimg = QtGui.QImage(nimg, w, h, w, QtGui.QImage.Format_Indexed8)
-        qimg.setColorTable(COLORTABLE)
-        self.image_to_display = qimg
+        # Normalize (or take prefetched planes of the projected channels) and
+        # display:
+        channels = self.control_window.displayed_channels()
+        shape = self.control_window.image_projected.shape[-2:]
+        if self.control_window.project[CHANNEL]:
+            self.image_to_display = reuse_buffer(self.image_to_display, shape,
+                                                 np.uint32)
+            planes = [channel.prefetcher.get(frame, z) for channel in channels]
+            composite(planes, out=self.image_to_display)
+        else:
+            self.image_to_display = reuse_buffer(self.image_to_display, shape)
+            channels[0].prefetcher.get(frame, z, out=self.image_to_display)
+        self.image_item.set_plane(self.image_to_display)
+        # (the mask does not depend on frames)
+        self.view.show_mask_slice()
         self.rescale_image_to_display()
 
+    @timed("rescale_image_to_display")
     def rescale_image_to_display(self):
-        # Clear the scene:
-        self.scene.clear()
         # Get image dimensions of the original image:
         _, _, h, w = self.control_window.image_projected.shape
         # Get current scale of the image
         scale = self.control_window.view["scale"]
-        # Adjust pixel map size:
-        pix_map = QtGui.QPixmap.fromImage(self.image_to_display)
-        pix_map = pix_map.scaled(scale*w, scale*h, QtCore.Qt.KeepAspectRatio)
-        # Display pixel map:
-        self.scene.addPixmap(pix_map)
-        self.scene.update()
+        # Zoom the view, the scene stays in image space:
+        self.scene.setSceneRect(0, 0, w, h)
+        self.view.setTransform(QtGui.QTransform.fromScale(scale, scale))
         # Adjust view size:
-        self.view.setFixedSize(scale*w, scale*h)
+        self.view.setFixedSize(int(scale*w), int(scale*h))
         # Draw scribbles:
         self.view.draw_scribbles()
         # Update Widget size:
@@ -489,63 +1278,26 @@ class ImageWindow(QtGui.QWidget):
                         self.control_window.zoom_in)
         QtGui.QShortcut(QtGui.QKeySequence("Ctrl+-"), self,
                         self.control_window.zoom_out)
+        QtGui.QShortcut(QtGui.QKeySequence("Ctrl+P"), self,
+                        self.toggle_profile_overlay)
+        QtGui.QShortcut(QtGui.QKeySequence("Ctrl+M"), self,
+                        self.toggle_mask_overlay)
+        QtGui.QShortcut(QtGui.QKeySequence("Ctrl+Z"), self,
+                        self.control_window.undo)
+        QtGui.QShortcut(QtGui.QKeySequence("Ctrl+Shift+Z"), self,
+                        self.control_window.redo)
+
+    def update_profile_overlay(self):
+        if self.profile_item.isVisible():
+            self.profile_item.setText("\n".join(RECORDER.summary()))
+
+    def toggle_profile_overlay(self):
+        if RECORDER.enabled:
+            self.profile_item.setVisible(not self.profile_item.isVisible())
+            self.update_profile_overlay()
+
+    def toggle_mask_overlay(self):
+        self.mask_item.setVisible(not self.mask_item.isVisible())
 
     def reset_scribbles(self):
-        self.view.scribbles = []
-        self.update_image_to_display()
-
-
-def read_image(path):
-    img = np.float64(tifffile.imread(path))
-    # print "Image of the shape is loaded", img.shape
-    ndim = len(img.shape)
-    if ndim == 2:
-        img = img.reshape((1, 1,) + img.shape)
-    elif ndim == 3:
-        img = img.reshape((1,) + img.shape)
-    elif ndim > 4:
-        raise Exception("To many dimensions...")
-    return img
-
-
-def normalize(image, vmin, vmax):
-    return np.uint8(255*(image - vmin)/(vmax - vmin))
-
-
-def pixel_centers_2d(min_height, max_height, min_width, max_width):
-    """Generate coordinates of pixel centers in image space in 2d bounding box.
-    """
-    nh = abs(max_height - min_height) + 1
-    nw = abs(max_width - min_width) + 1
-    v, u = np.meshgrid(np.linspace(min_height, max_height, nh),
-                       np.linspace(min_width, max_width, nw),
-                       indexing='ij')
-    # Note: v = height, u = width
-    px_centers = np.vstack([v.ravel(), u.ravel()]).T
-    return px_centers
-
-
-def line_pass_two_points_2d(p1, p2):
-    """Return (C, B, A) of a line Cy + Bx + A = 0 passing through p1 and p2.
-    """
-    ys, xs = p1[-2:]
-    ye, xe = p2[-2:]
-    return [xe - xs, ys - ye, ye*xs - ys*xe]
-
-
-def line_pass_square(c, p):
-    """Test if a line Cy + Bx + A = 0 pass through a unit square.
-
-    c: coordinates of the center (y, x).
-    p: parameters defining a line (C, B, A).
-
-    """
-    c = np.array(c, np.float64)
-    p = np.array(p, np.float64)
-    vertices = [c + [0.5, 0.5], c + [-0.5, 0.5],
-                c + [-0.5, -0.5], c + [0.5, -0.5]]
-    res = np.int16([np.sign(np.dot(list(v) + [1], p)) for v in vertices])
-    # At least two vertices have to be on different sides of the line:
-    if -1 in res and 1 in res:
-        return True
-    return False
+        self.view.clear_scribbles()
@@ -0,0 +1,327 @@
+"""Masks of scribbled pixels.
+
+Masks hold the label of the strokes covering a pixel (0 elsewhere), uint8
+or uint16 depending on the largest label.
+
+Scribbled pixels are only a tiny part of a volume, so masks are built as
+sparse masks (sorted indices of non-zero pixels and their values) and
+written to compressed, tiled TIFF files plane by plane: memory depends on
+the number of scribbled pixels, not on the size of the volume.
+
+Masks can also be saved as runs of pixels along rows (.npz of the shape,
+runs (z, y, x, length) and their values) to be read without decompressing
+the volume.
+
+While drawing, a LiveMask keeps the pixels of every stroke rasterized when it
+is added, so displaying or saving the mask never rasterizes all strokes again.
+
+"""
+
+import collections
+import numpy as np
+
+from .raster import stroke_pixels
+from .raster import unique_index
+
+# Value of scribbled pixels of binary masks:
+MASK_VALUE = 255
+# Size of tiles of written masks (multiple of 16):
+TILE_SIZE = 256
+
+
+class SparseMask(object):
+    """Mask (nslices, nheight, nwidth) stored as its non-zero pixels.
+
+    index: sorted flat indices of non-zero pixels in the volume.
+    values: values of the pixels.
+
+    """
+
+    def __init__(self, shape, index, values, dtype=np.uint8):
+        self.shape = tuple(shape)
+        self.index = index
+        self.values = values
+        self.dtype = np.dtype(dtype)
+
+    @classmethod
+    def from_pixels(cls, shape, pixels, value=MASK_VALUE):
+        """Create a mask from pixels (M, 3) set to a value."""
+        pixels = np.asarray(pixels, np.int64).reshape(-1, 3)
+        index = unique_index(np.ravel_multi_index(pixels.T, shape))
+        return cls(shape, index, np.full(len(index), value, np.uint8))
+
+    def __len__(self):
+        return len(self.index)
+
+    def plane(self, z):
+        """Return a dense plane (nheight, nwidth) of the mask."""
+        h, w = self.shape[-2:]
+        start, stop = np.searchsorted(self.index, [z*h*w, (z + 1)*h*w])
+        plane = np.zeros((h, w), self.dtype)
+        plane.flat[self.index[start:stop] - z*h*w] = self.values[start:stop]
+        return plane
+
+    def dense(self):
+        mask = np.zeros(self.shape, self.dtype)
+        mask.flat[self.index] = self.values
+        return mask
+
+    def runs(self):
+        """Return runs of equal pixels along rows.
+
+        Returns runs (R, 4) of (z, y, x, length) and values (R,).
+
+        """
+        w = self.shape[-1]
+        index, values = self.index, self.values
+        # A run starts where pixels are not consecutive in the same row or
+        # change value:
+        start = np.ones(len(index), bool)
+        start[1:] = ((index[1:] != index[:-1] + 1) |
+                     (index[1:] % w == 0) |
+                     (values[1:] != values[:-1]))
+        first = np.flatnonzero(start)
+        length = np.diff(np.append(first, len(index)))
+        z, y, x = np.unravel_index(index[first], self.shape)
+        runs = np.stack([z, y, x, length], axis=1).astype(np.int64)
+        return runs.reshape(-1, 4), values[first]
+
+    @classmethod
+    def from_runs(cls, shape, runs, values, dtype=np.uint8):
+        runs = np.asarray(runs, np.int64).reshape(-1, 4)
+        length = runs[:, 3]
+        first = np.ravel_multi_index(runs[:, :3].T, shape)
+        # Index of every pixel of every run:
+        run = np.repeat(np.arange(len(runs)), length)
+        offset = np.arange(len(run)) - np.repeat(np.cumsum(length) - length,
+                                                  length)
+        return cls(shape, first[run] + offset,
+                   np.asarray(values, dtype)[run], dtype)
+
+
+class LiveMask(object):
+    """Label mask (nslices, nheight, nwidth) updated stroke by stroke.
+
+    Pixels of a stroke are rasterized once in the image plane, planes and
+    the sparse mask are assembled from them. Pixels take the label of their
+    last stroke (strokes drawn later have priority).
+
+    value: value of pixels of all strokes (labels of strokes by default).
+
+    """
+
+    def __init__(self, shape, value=None):
+        self.shape = tuple(shape)
+        self.value = value
+        # Stroke id -> flat indices of pixels in a plane, range of slices,
+        # label:
+        self.pixels = collections.OrderedDict()
+
+    @classmethod
+    def from_scribbles(cls, scribbles, shape, value=None):
+        """Create the mask of all strokes of a ScribbleStore."""
+        mask = cls(shape, value)
+        for stroke_id, stroke in scribbles.strokes.items():
+            mask.add(stroke_id, stroke)
+        return mask
+
+    def __len__(self):
+        return len(self.pixels)
+
+    @property
+    def dtype(self):
+        """uint8 for labels up to 255, uint16 otherwise."""
+        labels = [label for _, _, label in self.pixels.values()]
+        return np.dtype(np.uint8 if max(labels + [0]) <= 255 else np.uint16)
+
+    def add(self, stroke_id, stroke):
+        """Rasterize a stroke (scribbles.Stroke), return its pixel indices."""
+        nslices, h, w = self.shape
+        index = stroke_pixels(stroke.points, (h, w), stroke.radius,
+                              stroke.fill)
+        slices = (max(stroke.slices[0], 0), min(stroke.slices[1], nslices))
+        label = stroke.label if self.value is None else self.value
+        self.restore(stroke_id, (index, slices, label))
+        return index
+
+    def remove(self, stroke_id):
+        """Remove pixels of a stroke, return them (None if not in the mask).
+        """
+        return self.pixels.pop(stroke_id, None)
+
+    def restore(self, stroke_id, pixels):
+        """Put back pixels of a stroke returned by `remove` (no rasterization).
+
+        Strokes stay ordered by id, so labels of overlapping strokes are the
+        same as before removal.
+
+        """
+        later = (len(self.pixels) > 0 and
+                 next(reversed(self.pixels)) > stroke_id)
+        self.pixels[stroke_id] = pixels
+        if later:
+            self.pixels = collections.OrderedDict(sorted(self.pixels.items()))
+
+    def strokes_at(self, index, z=None, stroke_ids=None):
+        """Return ids of strokes covering any of some pixels (hit-testing).
+
+        index: flat indices of pixels in a plane.
+        z: slice of the pixels, None for any slice.
+        stroke_ids: strokes to test (all by default), e.g. the strokes of the
+                    slice (see ScribbleStore.at_slice).
+
+        """
+        index = unique_index(np.asarray(index, np.int64).ravel())
+        hits = []
+        if len(index) == 0:
+            return hits
+        if stroke_ids is None:
+            stroke_ids = self.pixels
+        for stroke_id in sorted(stroke_ids):
+            if stroke_id not in self.pixels:
+                continue
+            pixels, (start, stop), _ = self.pixels[stroke_id]
+            if len(pixels) == 0 or z is not None and not start <= z < stop:
+                continue
+            # (no search if the pixels are out of the range of the stroke)
+            if index[-1] < pixels[0] or index[0] > pixels[-1]:
+                continue
+            # (pixels of strokes are sorted)
+            pos = np.minimum(np.searchsorted(pixels, index), len(pixels) - 1)
+            if np.any(pixels[pos] == index):
+                hits.append(stroke_id)
+        return hits
+
+    def labels_at(self, index, z=None):
+        """Return labels of some pixels of a plane (see `plane`).
+
+        index: flat indices of pixels in a plane.
+        z: slice, None for the projection of all slices.
+
+        Only the given pixels are looked up in the strokes, to update a
+        plane after a stroke is added or removed.
+
+        """
+        index = np.asarray(index, np.int64).ravel()
+        labels = np.zeros(len(index), self.dtype)
+        if len(index) == 0:
+            return labels
+        for pixels, (start, stop), label in self.pixels.values():
+            if len(pixels) == 0 or z is not None and not start <= z < stop:
+                continue
+            # (pixels of strokes are sorted, later strokes are drawn over)
+            pos = np.minimum(np.searchsorted(pixels, index), len(pixels) - 1)
+            labels[pixels[pos] == index] = label
+        return labels
+
+    def copy(self):
+        """Return a snapshot of the mask (pixels of strokes are shared)."""
+        mask = LiveMask(self.shape, self.value)
+        mask.pixels = collections.OrderedDict(self.pixels)
+        return mask
+
+    def plane(self, z=None, out=None):
+        """Return a plane (nheight, nwidth) of the mask.
+
+        z: slice, None for the projection of all slices.
+        out: array to write the plane to.
+
+        """
+        if out is None:
+            out = np.empty(self.shape[-2:], self.dtype)
+        out[...] = 0
+        for index, (start, stop), label in self.pixels.values():
+            if z is None or start <= z < stop:
+                out.flat[index] = label
+        return out
+
+    def sparse(self):
+        """Return the mask as a SparseMask (a single pass over all labels).
+        """
+        h, w = self.shape[-2:]
+        dtype = self.dtype
+        index, values = [], []
+        for pixels, (start, stop), label in self.pixels.values():
+            index.append((np.arange(start, stop)[:, None]*h*w +
+                          pixels).ravel())
+            values.append(np.full(len(index[-1]), label, dtype))
+        if not index:
+            return SparseMask(self.shape, np.zeros(0, np.int64),
+                              np.zeros(0, dtype), dtype)
+        index = np.concatenate(index)
+        values = np.concatenate(values)
+        if np.all(values == values[0]):
+            index = unique_index(index)
+            return SparseMask(self.shape, index,
+                              np.full(len(index), values[0], dtype), dtype)
+        # Pixels of several strokes take the label of the last one:
+        order = np.argsort(index, kind="stable")
+        index, values = index[order], values[order]
+        last = np.ones(len(index), bool)
+        last[:-1] = index[1:] != index[:-1]
+        return SparseMask(self.shape, index[last], values[last], dtype)
+
+
+def render_mask(scribbles, shape, value=None):
+    """Rasterize scribbles (ScribbleStore) to a dense mask.
+
+    shape: shape of the mask (nslices, nheight, nwidth).
+    value: value of scribbled pixels (labels of strokes by default).
+
+    """
+    return render_sparse_mask(scribbles, shape, value).dense()
+
+
+def render_sparse_mask(scribbles, shape, value=None):
+    """Rasterize scribbles (ScribbleStore) to a sparse mask."""
+    return LiveMask.from_scribbles(scribbles, shape, value).sparse()
+
+
+def iter_tiles(plane, tile_size=TILE_SIZE):
+    """Iterate over tiles of a plane in row-major order (padded with zeros).
+    """
+    h, w = plane.shape
+    for y in range(0, h, tile_size):
+        for x in range(0, w, tile_size):
+            data = plane[y:y + tile_size, x:x + tile_size]
+            tile = np.zeros((tile_size, tile_size), plane.dtype)
+            tile[:data.shape[0], :data.shape[1]] = data
+            yield tile
+
+
+def write_mask(path, mask, tile_size=TILE_SIZE, progress=None):
+    """Write a mask (dense array or SparseMask) to a compressed tiled TIFF.
+
+    progress: function called with the fraction of planes written.
+
+    """
+    import tifffile
+
+    def tiles():
+        for z in range(mask.shape[0]):
+            if progress is not None:
+                progress(float(z) / mask.shape[0])
+            plane = mask[z] if isinstance(mask, np.ndarray) else mask.plane(z)
+            for tile in iter_tiles(plane, tile_size):
+                yield tile
+
+    tifffile.imwrite(path, tiles(), shape=mask.shape, dtype=mask.dtype,
+                     tile=(tile_size, tile_size), compression="zlib",
+                     photometric="minisblack")
+    if progress is not None:
+        progress(1.)
+
+
+def write_runs(path, mask):
+    """Save a sparse mask as runs of pixels (.npz)."""
+    runs, values = mask.runs()
+    np.savez(path, shape=np.array(mask.shape, np.int64), runs=runs,
+             values=values)
+
+
+def read_runs(path):
+    """Load a sparse mask saved with write_runs."""
+    with np.load(path) as data:
+        shape = tuple(int(n) for n in data["shape"])
+        return SparseMask.from_runs(shape, data["runs"],
+                                    data["values"], data["values"].dtype)
@@ -0,0 +1,119 @@
+"""Prefetching of display planes while moving through an image.
+
+Planes ahead of the current position (in the direction and with the step of
+the last move) are read and converted for display in a worker thread, so
+moving through frames or slices mostly finds them ready.
+
+"""
+
+import threading
+import collections
+import numpy as np
+
+# Number of planes prefetched ahead of the current position:
+PREFETCH_DEPTH = 4
+# Number of display planes kept:
+CACHE_SIZE = 32
+
+
+class PlanePrefetcher(object):
+    """Bounded cache of display planes (frame, slice) filled by a worker.
+
+    The source is a 4D image (frame, slice, height, width) and a function
+    converting its planes for display (e.g. display.DisplayMapper).
+
+    """
+
+    def __init__(self, depth=PREFETCH_DEPTH, maxsize=CACHE_SIZE):
+        self.depth = depth
+        self.maxsize = maxsize
+        self.image = None
+        self.convert = None
+        self._cache = collections.OrderedDict()
+        self._queue = []
+        self._position = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def set_source(self, image, convert):
+        """Set image and conversion of planes, drop prepared planes."""
+        with self._condition:
+            self.image = image
+            self.convert = convert
+            self._cache.clear()
+            self._queue = []
+            self._position = None
+
+    def get(self, frame, z, out=None):
+        """Return the display plane at a position, prefetch the next ones.
+
+        out: array the plane is copied to (and returned), e.g. a persistent
+             display buffer, instead of returning the cached plane.
+
+        """
+        key = (frame, z)
+        with self._condition:
+            image, convert = self.image, self.convert
+            plane = self._cache.pop(key, None)
+            if plane is not None:
+                # Mark as recently used:
+                self._cache[key] = plane
+            self._schedule(key)
+        if plane is None:
+            plane = convert(image[frame, z])
+            self._insert(image, convert, key, plane)
+        if out is not None:
+            np.copyto(out, plane)
+            return out
+        return plane
+
+    def _schedule(self, key):
+        """Predict next positions from the last move (under the lock)."""
+        nframes, nslices = self.image.shape[:2]
+        if self._position is None or self._position == key:
+            # Not moving, prepare direct neighbours:
+            steps = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+            moves = [(key[0] + df, key[1] + dz) for df, dz in steps]
+        else:
+            df = key[0] - self._position[0]
+            dz = key[1] - self._position[1]
+            moves = [(key[0] + k*df, key[1] + k*dz)
+                     for k in range(1, self.depth + 1)]
+        self._position = key
+        self._queue = [(f, z) for f, z in moves
+                       if 0 <= f < nframes and 0 <= z < nslices and
+                       (f, z) not in self._cache]
+        self._condition.notify()
+
+    def _insert(self, image, convert, key, plane):
+        with self._condition:
+            # Skip planes of a previous source:
+            if image is not self.image or convert is not self.convert:
+                return
+            self._cache[key] = plane
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                key = self._queue.pop(0)
+                if key in self._cache:
+                    continue
+                image, convert = self.image, self.convert
+            self._insert(image, convert, key, convert(image[key]))
+
+    def close(self):
+        """Stop the worker and drop prepared planes."""
+        with self._condition:
+            self._closed = True
+            self._cache.clear()
+            self._condition.notify()
+        self._thread.join()
@@ -0,0 +1,298 @@
+"""Projections of 4D images (frame, slice, height, width) along frames/slices.
+
+Projections (mean, maximum, minimum or standard deviation) are streaming
+reductions over chunks of planes read from the image into a single
+accumulator of the size of the projection, in the dtype of the image or the
+smallest one that is exact (float32 for mean and standard deviation): the
+image can be larger than RAM. Chunks of arrays can be read and reduced by
+several threads sharing the accumulator. Projections are kept in a bounded
+cache to be reused.
+
+"""
+
+import threading
+import collections
+import numpy as np
+from multiprocessing.pool import ThreadPool
+
+# Number of planes read at once when computing a projection:
+CHUNK_SIZE = 16
+# Bytes of projections kept in a cache (the last one is kept anyway):
+CACHE_BYTES = 256 * 2**20
+
+# Projection operators:
+MEAN = "mean"
+MAX = "max"
+MIN = "min"
+STD = "std"
+OPERATORS = [MEAN, MAX, MIN, STD]
+
+
+def chunk_positions(shape, chunk_size=CHUNK_SIZE, frames=None):
+    """Return positions (frame, slices) of blocks of planes of an image.
+
+    frames: frames to read (all by default).
+
+    """
+    nframes, nslices = shape[:2]
+    if frames is None:
+        frames = range(nframes)
+    return [(frame, slice(z, min(z + chunk_size, nslices)))
+            for frame in frames for z in range(0, nslices, chunk_size)]
+
+
+def iter_chunks(image, chunk_size=CHUNK_SIZE, frames=None):
+    """Iterate over blocks of planes (frame, slices, block) of an image.
+
+    frames: frames to read (all by default).
+
+    """
+    for frame, zs in chunk_positions(image.shape, chunk_size, frames):
+        yield frame, zs, np.asarray(image[frame, zs])
+
+
+def sum_dtype(dtype, count):
+    """Return the smallest dtype holding sums of `count` values exactly
+    (float32 at least for floats)."""
+    dtype = np.dtype(dtype)
+    if dtype.kind not in "iu":
+        return np.promote_types(dtype, np.float32)
+    info = np.iinfo(dtype)
+    candidates = [np.uint16, np.uint32, np.uint64] if dtype.kind == "u" \
+        else [np.int16, np.int32, np.int64]
+    for candidate in candidates:
+        limits = np.iinfo(candidate)
+        if (limits.bits >= info.bits and info.max * count <= limits.max and
+                info.min * count >= limits.min):
+            return np.dtype(candidate)
+    return np.dtype(candidates[-1])
+
+
+class Accumulator(object):
+    """Reduction of the planes added so far into a projection.
+
+    count: number of planes reduced into every pixel of the projection.
+
+    Maximum and minimum are kept in the dtype of the image, sums in the
+    smallest dtype holding them exactly (see sum_dtype). The standard
+    deviation keeps the mean and the sum of squared deviations in float32,
+    merged chunk by chunk (no cancellation of large sums of squares).
+
+    Chunks are reduced with `reduce` (temporaries of the size of a chunk)
+    and added with `add`, which is the only step that has to be serialized
+    when several threads share an accumulator.
+
+    """
+
+    def __init__(self, operator, shape, dtype, count):
+        if operator not in OPERATORS:
+            raise ValueError("Unknown projection: {}".format(operator))
+        self.operator = operator
+        self.count = count
+        dtype = np.dtype(dtype)
+        if operator in (MAX, MIN):
+            info = np.iinfo(dtype) if dtype.kind in "iu" else np.finfo(dtype)
+            initial = info.min if operator == MAX else info.max
+            self.values = np.full(shape, initial, dtype)
+        elif operator == MEAN:
+            self.values = np.zeros(shape, sum_dtype(dtype, count))
+        else:
+            # Means, sums of squared deviations and numbers of planes added
+            # (per frame and slice of the projection):
+            self.values = np.zeros(shape, np.float32)
+            self.squares = np.zeros(shape, np.float32)
+            self.counts = np.zeros(shape[:2], np.int64)
+
+    def reduce(self, block, reduce_planes=False):
+        """Return the contribution of a block of planes (see `add`).
+
+        reduce_planes: reduce planes of the block into a single plane (the
+                       projection over slices), else add them one by one.
+
+        """
+        if self.operator in (MAX, MIN):
+            func = np.maximum if self.operator == MAX else np.minimum
+            return func.reduce(block, axis=0, keepdims=True) \
+                if reduce_planes else block
+        if self.operator == MEAN:
+            return block.sum(axis=0, dtype=self.values.dtype, keepdims=True) \
+                if reduce_planes else block
+        if not reduce_planes:
+            return 1, np.asarray(block, np.float64), 0.
+        # (a copy, the block may be the image itself or read-only)
+        block = np.array(block, np.float64)
+        mean = block.mean(axis=0, keepdims=True)
+        block -= mean
+        block *= block
+        return len(block), mean, block.sum(axis=0, keepdims=True)
+
+    def add(self, index, part):
+        """Add the contribution of a block at an index (frame, slices)."""
+        values = self.values[index]
+        if self.operator in (MAX, MIN):
+            func = np.maximum if self.operator == MAX else np.minimum
+            func(values, part, out=values)
+        elif self.operator == MEAN:
+            values += part
+        else:
+            n_b, mean_b, squares_b = part
+            n_a = self.counts[index].reshape(-1, 1, 1)
+            n = n_a + n_b
+            delta = mean_b - values
+            values += delta * (float(n_b) / n)
+            delta *= delta
+            delta *= n_a * float(n_b) / n
+            delta += squares_b
+            self.squares[index] += delta
+            self.counts[index] += n_b
+
+    def result(self):
+        """Return the projection (float32 for mean and std)."""
+        if self.operator in (MAX, MIN):
+            return self.values
+        if self.operator == MEAN:
+            if self.values.dtype == np.float32:
+                self.values /= self.count
+                return self.values
+            out = np.empty(self.values.shape, np.float32)
+            # (cast chunk by chunk, no temporary of the projection)
+            np.true_divide(self.values, self.count, out=out, casting="unsafe")
+            return out
+        self.squares /= self.count
+        return np.sqrt(self.squares, out=self.squares)
+
+
+def project(image, frame=False, slice_=False, chunk_size=CHUNK_SIZE,
+            stop=None, operator=MEAN, threads=1):
+    """Project an image over frames and/or slices, projected axes are kept.
+
+    operator: reduction of planes (MEAN, MAX, MIN or STD).
+    stop: optional threading.Event to interrupt the computation (then None
+          is returned).
+    threads: number of threads reading and reducing chunks of planes into
+             a shared accumulator. Only arrays (e.g. memory-mapped files)
+             are read by several threads, lazily decoded stacks (see
+             stack.py) are read by the calling thread.
+
+    """
+    nframes, nslices, h, w = image.shape
+    # (projecting a single frame or slice gives the image itself)
+    frame = frame and nframes > 1
+    slice_ = slice_ and nslices > 1
+    if not (frame or slice_):
+        return image
+    shape = (1 if frame else nframes, 1 if slice_ else nslices, h, w)
+    count = (nframes if frame else 1) * (nslices if slice_ else 1)
+    acc = Accumulator(operator, shape, image.dtype, count)
+    lock = threading.Lock()
+    positions = chunk_positions(image.shape, chunk_size)
+
+    def reduce_chunks(positions):
+        for f, zs in positions:
+            if stop is not None and stop.is_set():
+                return False
+            part = acc.reduce(np.asarray(image[f, zs]), slice_)
+            with lock:
+                acc.add((0 if frame else f, slice(0, 1) if slice_ else zs),
+                        part)
+        return True
+
+    if not isinstance(image, np.ndarray):
+        threads = 1
+    threads = max(1, min(threads, len(positions)))
+    if threads == 1:
+        done = [reduce_chunks(positions)]
+    else:
+        pool = ThreadPool(threads)
+        try:
+            done = pool.map(reduce_chunks, [positions[i::threads]
+                                            for i in range(threads)])
+        finally:
+            pool.close()
+            pool.join()
+    if not all(done):
+        return None
+    return acc.result()
+
+
+class ProjectionCache(object):
+    """Bounded cache of projections of an image keyed by (frame, slice, op).
+
+    A key tells whether the image is projected over frames and over slices
+    and with which operator (MEAN if omitted).
+    The least recently used projections are dropped first when they take
+    more than `maxbytes`.
+
+    """
+
+    def __init__(self, image, maxbytes=CACHE_BYTES, chunk_size=CHUNK_SIZE,
+                 threads=1):
+        self.image = image
+        self.maxbytes = maxbytes
+        self.chunk_size = chunk_size
+        self.threads = threads
+        self._cache = collections.OrderedDict()
+        # Projections being computed (key -> threading.Event):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def get(self, key):
+        """Return projection for a key, compute it if it is not cached."""
+        nframes, nslices = self.image.shape[:2]
+        frame = key[0] and nframes > 1
+        slice_ = key[1] and nslices > 1
+        operator = key[2] if len(key) > 2 else MEAN
+        if not (frame or slice_):
+            return self.image
+        key = (frame, slice_, operator)
+        with self._lock:
+            if key in self._cache:
+                # Mark as recently used:
+                value = self._cache.pop(key)
+                self._cache[key] = value
+                return value
+            event = self._pending.get(key)
+            owner = event is None
+            if owner:
+                event = self._pending[key] = threading.Event()
+        if not owner:
+            # Wait for another thread to compute it:
+            event.wait()
+            return self.get(key)
+        value = None
+        try:
+            value = project(self.image, frame, slice_, self.chunk_size,
+                            self._stop, operator, self.threads)
+        finally:
+            with self._lock:
+                if value is not None:
+                    self._cache[key] = value
+                    while (len(self._cache) > 1 and
+                           sum(v.nbytes for v in self._cache.values()) >
+                           self.maxbytes):
+                        self._cache.popitem(last=False)
+                self._pending.pop(key).set()
+        return value
+
+    def prefetch(self, keys):
+        """Compute projections in a background thread."""
+        def run():
+            for key in keys:
+                if self._stop.is_set():
+                    break
+                self.get(key)
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+        return thread
+
+    def close(self):
+        """Interrupt background computations and drop cached projections."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        with self._lock:
+            self._cache.clear()
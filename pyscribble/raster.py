@@ -0,0 +1,245 @@
+"""Vectorized rasterization of scribbles into a mask.
+
+A segment between two pixel centers ps and pe selects every pixel of the
+bounding box of the segment whose unit square is crossed by the line passing
+through ps and pe (i.e. the corners of the square lie strictly on different
+sides of the line). This is the rule implemented pixel by pixel in
+`core.line_pass_square`; here all segments are processed at once, walking
+along each segment so the work is proportional to its length (not to the
+area of its bounding box). `segment_cells` is the query of a batch of 2D
+segments against the pixel grid, also used for hit-testing.
+
+"""
+
+import math
+import numpy as np
+
+
+def points_to_segments(points, shape):
+    """Connect consecutive points of a polyline into segments.
+
+    points: array of shape (N, D) of point coordinates, e.g. (z, y, x).
+    shape: shape of the mask the points are drawn to (D dimensions).
+
+    Points outside of the mask are dropped and the remaining points are
+    converted to pixel indices before they are connected. Returns an integer
+    array of shape (N - 1, 2, D) (fewer segments if points are dropped).
+
+    """
+    ndim = len(shape)
+    pts = np.array(points, np.float64).reshape(-1, ndim)
+    inside = np.all((0 <= pts) & (pts < shape), axis=1)
+    pts = np.int64(pts[inside])
+    if len(pts) < 2:
+        return np.zeros((0, 2, ndim), np.int64)
+    return np.stack([pts[:-1], pts[1:]], axis=1)
+
+
+def scribbles_to_segments(scribbles, shape):
+    """Convert scribbles to an array of segments of shape (N, 2, 3).
+
+    scribbles: sequence of scribbles, each a sequence of points (z, y, x).
+    shape: shape of the mask (nslices, nheight, nwidth).
+
+    """
+    segments = [points_to_segments(scribble, shape[-3:])
+                for scribble in scribbles]
+    if not segments:
+        return np.zeros((0, 2, 3), np.int64)
+    return np.concatenate(segments)
+
+
+def segment_cells(segments):
+    """Return the pixels (cells of the grid) crossed by a batch of segments.
+
+    segments: integer array of shape (N, 2, 2), start and end point (y, x)
+              of each segment.
+
+    Returns cells (M, 2) of (y, x) and the index (M,) of the segment crossing
+    each of them. M is at most twice the total length of the segments, a
+    pixel crossed by several segments appears once per segment.
+
+    """
+    segments = np.asarray(segments, np.int64).reshape(-1, 2, 2)
+    if len(segments) == 0:
+        return np.zeros((0, 2), np.int64), np.zeros(0, np.int64)
+    ys, xs = segments[:, 0, 0], segments[:, 0, 1]
+    ye, xe = segments[:, 1, 0], segments[:, 1, 1]
+    dy, dx = ye - ys, xe - xs
+
+    # Walk along the major axis of each segment, one step per pixel:
+    steep = np.abs(dy) > np.abs(dx)
+    # (major, minor) coordinates of the start point and their increments:
+    a0 = np.where(steep, ys, xs)
+    b0 = np.where(steep, xs, ys)
+    da = np.where(steep, dy, dx)
+    db = np.where(steep, dx, dy)
+    n = np.abs(da) + 1
+    seg = np.repeat(np.arange(len(segments)), n)
+    offsets = np.cumsum(n) - n
+    t = np.arange(seg.size) - offsets[seg]
+    step = np.sign(da)[seg] * t
+    a = a0[seg] + step
+    # The line crosses at most two pixels per step along the major axis,
+    # starting with floor of the exact minor coordinate:
+    da_ = np.where(da == 0, 1, da)[seg]
+    b = b0[seg] + (db[seg]*step) // da_
+    a = np.concatenate([a, a])
+    b = np.concatenate([b, b + 1])
+    seg = np.concatenate([seg, seg])
+
+    # Keep pixels whose square is crossed by the line (exact, in integers):
+    # |dx*(y - ys) - dy*(x - xs)| < (|dx| + |dy|)/2
+    y = np.where(steep[seg], a, b)
+    x = np.where(steep[seg], b, a)
+    dist = dx[seg]*(y - ys[seg]) - dy[seg]*(x - xs[seg])
+    keep = 2*np.abs(dist) < np.abs(dx[seg]) + np.abs(dy[seg])
+    # ... within the bounding box of the segment:
+    keep &= (np.minimum(ys, ye)[seg] <= y) & (y <= np.maximum(ys, ye)[seg])
+    keep &= (np.minimum(xs, xe)[seg] <= x) & (x <= np.maximum(xs, xe)[seg])
+    # A degenerate segment selects its single pixel:
+    keep |= (dx[seg] == 0) & (dy[seg] == 0) & (b == b0[seg])
+    return np.stack([y, x], axis=1)[keep], seg[keep]
+
+
+def rasterize_segments(segments):
+    """Return indices (z, y, x) of pixels covered by segments.
+
+    segments: integer array of shape (N, 2, 3), start and end point (z, y, x)
+              of each segment. Both points of a segment must share z.
+
+    The output has shape (M, 3) and may contain the same pixel several times.
+
+    """
+    segments = np.asarray(segments, np.int64).reshape(-1, 2, 3)
+    if len(segments) == 0:
+        return np.zeros((0, 3), np.int64)
+    z = segments[:, 0, 0]
+    assert np.all(z == segments[:, 1, 0])
+    cells, seg = segment_cells(segments[:, :, 1:])
+    return np.column_stack([z[seg], cells])
+
+
+def draw_segments(mask, segments, value=255):
+    """Set pixels of a mask (nslices, nheight, nwidth) covered by segments."""
+    px = rasterize_segments(segments)
+    mask[px[:, 0], px[:, 1], px[:, 2]] = value
+    return mask
+
+
+def rasterize_scribbles(scribbles, shape, value=255, mask=None):
+    """Draw scribbles into a mask of a given shape (nslices, nheight, nwidth).
+    """
+    if mask is None:
+        mask = np.zeros(shape, np.uint8)
+    return draw_segments(mask, scribbles_to_segments(scribbles, mask.shape),
+                         value)
+
+
+def unique_index(index):
+    """Return sorted unique values of an integer array.
+
+    Note: sorting is much faster than np.unique for large arrays of indices
+    with recent numpy versions (which use a hash table).
+
+    """
+    index = np.sort(index)
+    keep = np.ones(len(index), bool)
+    keep[1:] = index[1:] != index[:-1]
+    return index[keep]
+
+
+def dilate(canvas, radius):
+    """Dilate a boolean image by a disk of a given radius (pixels).
+
+    The disk is processed row by row: a row of the disk dilates the image
+    along x (difference of cumulative sums), shifted up and down by dy.
+
+    """
+    h, w = canvas.shape
+    cs = np.zeros((h, w + 1), np.int32)
+    np.cumsum(canvas, axis=1, out=cs[:, 1:])
+    x = np.arange(w)
+    out = np.zeros_like(canvas)
+    for dy in range(min(int(radius), h - 1) + 1):
+        # Half width of the row of the disk (dx**2 + dy**2 <= radius**2):
+        k = int(math.sqrt(radius**2 - dy**2))
+        while (k + 1)**2 + dy**2 <= radius**2:
+            k += 1
+        while k**2 + dy**2 > radius**2:
+            k -= 1
+        row = cs[:, np.minimum(x + k + 1, w)] > cs[:, np.maximum(x - k, 0)]
+        out[dy:] |= row[:h - dy]
+        if dy > 0:
+            out[:h - dy] |= row[dy:]
+    return out
+
+
+def fill_polygon(points, shape):
+    """Return a boolean image of pixels whose centers are inside a polygon.
+
+    points: vertices (N, 2) of a closed polygon (y, x), even-odd rule.
+
+    Rows are filled between pairs of crossings of edges (scanline fill), a
+    row crosses an edge if its center is in [min(y0, y1), max(y0, y1)).
+
+    """
+    pts = np.array(points, np.float64).reshape(-1, 2)
+    h, w = shape
+    if len(pts) < 3:
+        return np.zeros(shape, bool)
+    y0, x0 = pts.T
+    y1, x1 = np.roll(pts, -1, axis=0).T
+    # Rows crossing each edge:
+    r0 = np.clip(np.ceil(np.minimum(y0, y1) - 0.5), 0, h).astype(np.int64)
+    r1 = np.clip(np.ceil(np.maximum(y0, y1) - 0.5), 0, h).astype(np.int64)
+    n = np.maximum(r1 - r0, 0)
+    edge = np.repeat(np.arange(len(pts)), n)
+    row = r0[edge] + np.arange(edge.size) - np.repeat(np.cumsum(n) - n, n)
+    # (horizontal edges cross no row)
+    dy = np.where(y1 == y0, 1., y1 - y0)[edge]
+    x = x0[edge] + (row + 0.5 - y0[edge]) * (x1 - x0)[edge] / dy
+    # Crossings of a row are paired from left to right:
+    order = np.lexsort((x, row))
+    row, x = row[order], x[order]
+    rows, xa, xb = row[0::2], x[0::2], x[1::2]
+    # Columns [c0, c1) of pixel centers between crossings:
+    c0 = np.clip(np.ceil(xa - 0.5), 0, w).astype(np.int64)
+    c1 = np.clip(np.ceil(xb - 0.5), 0, w).astype(np.int64)
+    diff = np.zeros((h, w + 1), np.int32)
+    np.add.at(diff, (rows, c0), 1)
+    np.add.at(diff, (rows, c1), -1)
+    return np.cumsum(diff[:, :w], axis=1) > 0
+
+
+def stroke_pixels(points, shape, radius=0, fill=False):
+    """Return sorted flat indices of pixels of a stroke in a plane.
+
+    points: polyline (N, 2) of points (y, x).
+    shape: shape of the plane (nheight, nwidth).
+    radius: radius of the brush (pixels), 0 for the line itself.
+    fill: close the polyline and fill it (lasso).
+
+    A thick or filled stroke is drawn into a boolean image covering its
+    bounding box only.
+
+    """
+    points = np.array(points, np.float64).reshape(-1, 2)
+    fill = fill and len(points) > 2
+    if fill:
+        points = np.concatenate([points, points[:1]])
+    px, _ = segment_cells(points_to_segments(points, shape))
+    if len(px) == 0 or not (radius > 0 or fill):
+        return unique_index(np.ravel_multi_index(px.T, shape))
+    # Bounding box of the stroke (polygon inside of its outline's box):
+    margin = int(math.ceil(radius))
+    lo = np.maximum(px.min(axis=0) - margin, 0)
+    hi = np.minimum(px.max(axis=0) + margin + 1, shape)
+    canvas = np.zeros(hi - lo, bool)
+    canvas[px[:, 0] - lo[0], px[:, 1] - lo[1]] = True
+    if radius > 0:
+        canvas = dilate(canvas, radius)
+    if fill:
+        canvas |= fill_polygon(points - lo, canvas.shape)
+    y, x = np.nonzero(canvas)
+    return np.ravel_multi_index((y + lo[0], x + lo[1]), shape)
@@ -0,0 +1,85 @@
+"""Render masks from saved scribbles without a GUI.
+
+Each file of scribbles (see scribbles.save_scribbles) is rasterized to a mask
+written next to it: "<name>-scribbles.npz" gives "<name>-mask.tif" (and
+optionally runs of the mask "<name>-mask.npz"). Files are processed in
+parallel by a pool of processes.
+
+"""
+
+import os
+import time
+import multiprocessing
+import numpy as np
+
+from .masks import render_sparse_mask
+from .masks import write_mask
+from .masks import write_runs
+from .scribbles import SCRIBBLES_SUFFIX
+from .scribbles import load_scribbles
+
+MASK_SUFFIX = "-mask.tif"
+RUNS_SUFFIX = "-mask.npz"
+
+
+def mask_path(path_scribbles, suffix=MASK_SUFFIX):
+    """Return path of the mask rendered from a file of scribbles."""
+    if path_scribbles.endswith(SCRIBBLES_SUFFIX):
+        base = path_scribbles[:-len(SCRIBBLES_SUFFIX)]
+    else:
+        base = os.path.splitext(path_scribbles)[0]
+    return base + suffix
+
+
+def render_file(path_scribbles, runs=False):
+    """Render and write the mask of a file of scribbles.
+
+    runs: also save runs of the mask.
+
+    Returns the path of the mask and the number of voxels of the mask.
+
+    """
+    scribbles, shape = load_scribbles(path_scribbles)
+    mask = render_sparse_mask(scribbles, shape)
+    path = mask_path(path_scribbles)
+    write_mask(path, mask)
+    if runs:
+        write_runs(mask_path(path_scribbles, RUNS_SUFFIX), mask)
+    return path, int(np.prod(shape))
+
+
+def render_file_with_runs(path_scribbles):
+    return render_file(path_scribbles, runs=True)
+
+
+def render_files(paths, processes=None, log=None, runs=False):
+    """Render masks of files of scribbles with a pool of processes.
+
+    processes: number of processes (number of CPUs by default).
+    log: function called with a line of text for every rendered mask.
+    runs: also save runs of masks.
+
+    Returns throughput statistics.
+
+    """
+    start = time.time()
+    nvoxels = 0
+    pool = multiprocessing.Pool(processes)
+    try:
+        render = render_file_with_runs if runs else render_file
+        for path, size in pool.imap_unordered(render, paths):
+            nvoxels += size
+            if log is not None:
+                log(path)
+    finally:
+        pool.close()
+        pool.join()
+    elapsed = max(time.time() - start, 1e-9)
+    stats = {"masks": len(paths), "voxels": nvoxels, "seconds": elapsed,
+             "masks_per_second": len(paths) / elapsed,
+             "voxels_per_second": nvoxels / elapsed}
+    if log is not None:
+        log("Rendered {masks} masks ({voxels} voxels) in {seconds:.2f} s: "
+            "{masks_per_second:.1f} masks/s, "
+            "{voxels_per_second:.3g} voxels/s".format(**stats))
+    return stats
@@ -0,0 +1,308 @@
+"""Storage of scribbles drawn on an image.
+
+A stroke is a polyline in the image plane (y, x) drawn at a range of slices:
+a single slice, or all slices when it is drawn on a slice projection. It is
+drawn with a brush of a given radius, can be closed and filled (lasso) and
+carries a label (the value of its pixels in masks).
+Strokes are indexed by slice, so the strokes of a slice are found without
+looking at any point. Changes are kept as stroke-level deltas (a stroke added
+or removed) to be undone and redone.
+
+Scribbles are saved to .npz files of flat arrays: points of all strokes
+(float32), offsets of strokes in the points, slice ranges, frames, brush
+radii, fill flags and labels of strokes and the shape of the mask (nslices,
+nheight, nwidth).
+
+"""
+
+import os
+import re
+import glob
+import math
+import collections
+import numpy as np
+
+
+# Files of scribbles of an image "<name>.tif" are named "<name>-scribbles.npz":
+SCRIBBLES_SUFFIX = "-scribbles.npz"
+
+# Label of strokes by default (value of pixels of binary masks):
+DEFAULT_LABEL = 255
+
+# points: array (n, 2) of (y, x) in float32 (as saved);
+# slices: range [start, stop) of slices; frame: frame the stroke was drawn at;
+# radius: radius of the brush (0 for a line); fill: whether it is a lasso;
+# label: label of its pixels.
+Stroke = collections.namedtuple("Stroke", ["points", "slices", "frame",
+                                           "radius", "fill", "label"])
+
+
+class ScribbleStore(object):
+    """Strokes indexed by an id and by slice, with a history of changes.
+
+    Strokes are kept in the order of their ids (order they were drawn).
+    A change is a tuple (stroke_id, stroke, added).
+
+    """
+
+    def __init__(self):
+        self.strokes = collections.OrderedDict()
+        self._by_slice = collections.defaultdict(set)
+        self._next_id = 0
+        # Changes that can be undone and redone:
+        self._undo = []
+        self._redo = []
+
+    def __len__(self):
+        return len(self.strokes)
+
+    def __iter__(self):
+        return iter(self.strokes)
+
+    def add(self, points, slices, frame=0, radius=0, fill=False,
+            label=DEFAULT_LABEL):
+        """Add a stroke and return its id.
+
+        points: sequence of points (y, x).
+        slices: range [start, stop) of slices the stroke is drawn at.
+        radius: radius of the brush (pixels).
+        fill: close the stroke and fill it.
+        label: label of pixels of the stroke (> 0).
+
+        """
+        stroke_id = self._next_id
+        self._next_id += 1
+        points = np.array(points, np.float32).reshape(-1, 2)
+        stroke = Stroke(points, (int(slices[0]), int(slices[1])), frame,
+                        radius, bool(fill), int(label))
+        self._insert(stroke_id, stroke)
+        self._record((stroke_id, stroke, True))
+        return stroke_id
+
+    def remove(self, stroke_id):
+        stroke = self._discard(stroke_id)
+        self._record((stroke_id, stroke, False))
+        return stroke
+
+    def undo(self):
+        """Revert the last change and return it (None if there is none)."""
+        if not self._undo:
+            return None
+        change = self._undo.pop()
+        self._apply(change, reverse=True)
+        self._redo.append(change)
+        return change
+
+    def redo(self):
+        """Apply the last undone change again and return it (or None)."""
+        if not self._redo:
+            return None
+        change = self._redo.pop()
+        self._apply(change)
+        self._undo.append(change)
+        return change
+
+    def history_ids(self):
+        """Return ids of strokes of changes that can be undone or redone."""
+        return set(change[0] for change in self._undo + self._redo)
+
+    def clear_history(self):
+        self._undo = []
+        self._redo = []
+
+    def _record(self, change):
+        self._undo.append(change)
+        # (a new change discards undone ones)
+        self._redo = []
+
+    def _apply(self, change, reverse=False):
+        stroke_id, stroke, added = change
+        if added != reverse:
+            self._insert(stroke_id, stroke)
+        else:
+            self._discard(stroke_id)
+
+    def _insert(self, stroke_id, stroke):
+        later = (len(self.strokes) > 0 and
+                 next(reversed(self.strokes)) > stroke_id)
+        self.strokes[stroke_id] = stroke
+        if later:
+            # A restored stroke goes back before strokes drawn after it:
+            self.strokes = collections.OrderedDict(
+                sorted(self.strokes.items()))
+        for z in range(*stroke.slices):
+            self._by_slice[z].add(stroke_id)
+
+    def _discard(self, stroke_id):
+        stroke = self.strokes.pop(stroke_id)
+        for z in range(*stroke.slices):
+            self._by_slice[z].discard(stroke_id)
+        return stroke
+
+    def at_slice(self, z):
+        """Return ids of strokes drawn at a slice."""
+        return self._by_slice.get(z, set())
+
+
+def simplify(points, tolerance=0.):
+    """Simplify a polyline with the Ramer-Douglas-Peucker algorithm.
+
+    points: array (N, 2) of points.
+    tolerance: maximal distance (pixels) of removed points to the simplified
+               polyline. With 0 only points lying on the segment between
+               their neighbours are removed.
+
+    """
+    points = np.asarray(points)
+    if len(points) < 3:
+        return points
+    keep = np.zeros(len(points), bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        # Distance of points to the segment (start, end):
+        p0 = np.float64(points[start])
+        d = np.float64(points[end]) - p0
+        v = np.float64(points[start + 1:end]) - p0
+        norm2 = d.dot(d)
+        if norm2 == 0:
+            dist2 = (v**2).sum(axis=1)
+        else:
+            t = np.clip(v.dot(d) / norm2, 0, 1)
+            dist2 = ((v - t[:, None]*d)**2).sum(axis=1)
+        i = np.argmax(dist2)
+        if dist2[i] > tolerance**2:
+            i += start + 1
+            keep[i] = True
+            stack += [(start, i), (i, end)]
+    return points[keep]
+
+
+class StrokeInput(object):
+    """Points of a stroke being drawn, snapped to pixel centers.
+
+    Points outside of the image and points repeating the previous pixel are
+    dropped: the rasterized stroke is the same as with all input points.
+
+    """
+
+    def __init__(self, shape):
+        self.shape = shape[-2:]
+        self.points = []
+        # Whether the only pixel of the stroke was given several times:
+        self._repeated = False
+
+    def add(self, y, x):
+        """Add a point (y, x), return the snapped point or None if dropped."""
+        h, w = self.shape
+        if not (0 <= y < h and 0 <= x < w):
+            return None
+        point = (math.floor(y) + 0.5, math.floor(x) + 0.5)
+        if self.points and point == self.points[-1]:
+            self._repeated = True
+            return None
+        self.points.append(point)
+        return point
+
+    def finish(self, tolerance=0.):
+        """Return points (N, 2) of the stroke simplified with a tolerance.
+
+        tolerance: see `simplify`, None not to simplify.
+
+        """
+        points = np.array(self.points, np.float32).reshape(-1, 2)
+        if len(points) == 1 and self._repeated:
+            # Keep a segment selecting the pixel:
+            return points[[0, 0]]
+        if tolerance is not None:
+            points = simplify(points, tolerance)
+        return points
+
+
+def image_name(path_image):
+    """Return the name of an image to name files derived from it.
+
+    The name of a file without extension, of a directory or of a glob pattern
+    of files without wildcards ("img_*.tif" gives "img").
+
+    """
+    path = os.path.normpath(path_image)
+    name = re.split(r"[*?[]", os.path.basename(path))[0]
+    name = name.split(".")[0].rstrip("_- ")
+    return name or os.path.basename(os.path.dirname(path))
+
+
+def derived_path(path_image, suffix):
+    """Return the path of a file derived from an image ("<name><suffix>").
+
+    Files are next to the image, or next to the folder of a series of files
+    (directory or glob pattern): in the folder of a pattern they could match
+    it and be read as planes of the series.
+
+    """
+    path = os.path.normpath(path_image)
+    folder_name = os.path.dirname(path)
+    if glob.has_magic(os.path.basename(path)) and not os.path.isfile(path):
+        folder_name = os.path.dirname(folder_name)
+    return os.path.join(folder_name, image_name(path_image) + suffix)
+
+
+def scribbles_path(path_image):
+    """Return path of the file of scribbles of an image."""
+    return derived_path(path_image, SCRIBBLES_SUFFIX)
+
+
+def save_scribbles(path, scribbles, shape):
+    """Save scribbles drawn on an image with a mask of a given shape."""
+    strokes = list(scribbles.strokes.values())
+    npoints = [len(stroke.points) for stroke in strokes]
+    offsets = np.zeros(len(strokes) + 1, np.int64)
+    offsets[1:] = np.cumsum(npoints)
+    if strokes:
+        points = np.concatenate([stroke.points for stroke in strokes])
+    else:
+        points = np.zeros((0, 2), np.float32)
+    np.savez(path,
+             points=points,
+             offsets=offsets,
+             slices=np.array([stroke.slices for stroke in strokes],
+                             np.int64).reshape(-1, 2),
+             frames=np.array([stroke.frame for stroke in strokes], np.int64),
+             radii=np.array([stroke.radius for stroke in strokes],
+                            np.float64),
+             fill=np.array([stroke.fill for stroke in strokes], bool),
+             labels=np.array([stroke.label for stroke in strokes], np.int64),
+             shape=np.array(shape[-3:], np.int64))
+
+
+def load_scribbles(path):
+    """Load scribbles saved with save_scribbles.
+
+    Returns the scribbles (ScribbleStore) and the shape of the mask.
+
+    """
+    scribbles = ScribbleStore()
+    with np.load(path) as data:
+        points = data["points"]
+        offsets = data["offsets"]
+        nstrokes = len(data["frames"])
+        # (files saved before brushes have lines only, before labels have
+        # the default label)
+        radii = data["radii"] if "radii" in data.files else \
+            np.zeros(nstrokes)
+        fill = data["fill"] if "fill" in data.files else \
+            np.zeros(nstrokes, bool)
+        labels = data["labels"] if "labels" in data.files else \
+            np.full(nstrokes, DEFAULT_LABEL)
+        for i, (slices, frame) in enumerate(zip(data["slices"],
+                                                data["frames"])):
+            scribbles.add(points[offsets[i]:offsets[i + 1]], slices,
+                          int(frame), float(radii[i]), bool(fill[i]),
+                          int(labels[i]))
+        shape = tuple(int(n) for n in data["shape"])
+    # (loaded strokes are not changes to undo)
+    scribbles.clear_history()
+    return scribbles, shape
@@ -0,0 +1,376 @@
+"""Lazy access to image stacks stored on disk.
+
+Images are presented as 4D arrays (frame, slice, height, width) of their
+native dtype, one per channel. Nothing is read when a stack is opened:
+uncompressed files are memory-mapped and other files are decoded page by
+page on access, only planes of the opened channel are read.
+
+Dimensions are known from the axes stored in the file (e.g. "TZCYX" for
+ImageJ hyperstacks), otherwise they are (frame, slice, channel, height,
+width) with leading dimensions missing.
+
+A directory or a glob pattern of TIFF files (e.g. one file per time point
+or per slice) is opened as a single stack: frames and slices are ordered by
+the numbers following "t" and "z" in the file names (by name otherwise, a
+file per frame). Files are only opened when their planes are read, a
+bounded number at once.
+
+tifffile is only imported when a file is opened.
+
+"""
+
+import os
+import re
+import glob
+import threading
+import collections
+import numpy as np
+
+# Dimensions of images (frame, slice, channel, height, width):
+AXES = "TZCYX"
+
+# Extensions of files of a series given as a directory:
+TIFF_EXTENSIONS = (".tif", ".tiff")
+# Indices of frames and slices in file names of a series ("img_t001_z02"):
+FRAME_PATTERN = re.compile(r"(?:^|[^a-zA-Z])[tT](\d+)")
+SLICE_PATTERN = re.compile(r"(?:^|[^a-zA-Z])[zZ](\d+)")
+# Number of files of a series kept open:
+MAX_OPEN_FILES = 32
+
+
+def as_4d_shape(shape):
+    """Prepend singleton frame/slice dimensions to a 2D or 3D shape."""
+    shape = tuple(shape)
+    if len(shape) > 4:
+        raise Exception("To many dimensions...")
+    return (1,) * (4 - len(shape)) + shape
+
+
+def stack_axes(shape, axes=None):
+    """Return axes (letters of AXES) of the dimensions of an image.
+
+    axes: axes stored in the file, used if they are all known.
+
+    """
+    if (axes is not None and len(axes) == len(shape) and
+            axes.endswith("YX") and set(axes) <= set(AXES) and
+            len(set(axes)) == len(axes)):
+        return axes
+    if len(shape) > 5:
+        raise Exception("To many dimensions...")
+    return {2: "YX", 3: "ZYX", 4: "TZYX", 5: "TZCYX"}[len(shape)]
+
+
+def as_5d_shape(shape, axes):
+    """Return shape (frame, slice, channel, height, width) of an image."""
+    sizes = dict(zip(axes, shape))
+    return tuple(sizes.get(axis, 1) for axis in AXES)
+
+
+def read_axes(path):
+    """Return shape and axes of the image of a TIFF file (no data read)."""
+    import tifffile
+    with tifffile.TiffFile(path) as tif:
+        series = tif.series[0]
+        return series.shape, stack_axes(series.shape, series.axes)
+
+
+def count_channels(path):
+    if is_series(path):
+        path = series_files(path)[0][0]
+    return as_5d_shape(*read_axes(path))[2]
+
+
+def open_stack(path, channel=0):
+    """Open a channel of a TIFF file (or series of files) as a 4D array-like
+    without reading the image data."""
+    if is_series(path):
+        return FileSeries(path, channel)
+    import tifffile
+    try:
+        img = tifffile.memmap(path, mode="r")
+    except ValueError:
+        # Compressed or fragmented data can not be memory-mapped:
+        return TiffStack(path, channel)
+    shape, axes = read_axes(path)
+    return channel_view(img, axes, channel)
+
+
+def channel_view(img, axes, channel):
+    """Return the 4D view of a channel of an array with given axes."""
+    # Views with dimensions in the order of AXES (nothing is read):
+    img = np.transpose(img, [axes.index(axis) for axis in AXES
+                             if axis in axes])
+    for i, axis in enumerate(AXES):
+        if axis not in axes:
+            img = np.expand_dims(img, i)
+    return img[:, :, channel]
+
+
+def is_series(path):
+    """Whether a path is a directory or a glob pattern of files.
+
+    Existing files are never patterns (even with "[", "*" or "?" in their
+    names).
+
+    """
+    if os.path.isfile(path):
+        return False
+    return os.path.isdir(path) or glob.has_magic(path)
+
+
+def natural_key(name):
+    """Sort key of names with numbers in numerical order ("f2" < "f10")."""
+    return [int(part) if part.isdigit() else part
+            for part in re.split(r"(\d+)", name)]
+
+
+def series_files(path):
+    """Return files of a series ordered in a grid (frame, slice).
+
+    Returns a list (one per frame) of lists (one per slice) of paths.
+
+    """
+    if os.path.isdir(path):
+        paths = [os.path.join(path, name) for name in os.listdir(path)
+                 if name.lower().endswith(TIFF_EXTENSIONS)]
+    else:
+        paths = glob.glob(path)
+    if not paths:
+        raise IOError("No TIFF files in {}".format(path))
+    names = [os.path.splitext(os.path.basename(p))[0] for p in paths]
+
+    def indices(pattern):
+        # Index of every file (None if some file has no index):
+        matches = [pattern.findall(name) for name in names]
+        if not all(matches):
+            return None
+        return [int(match[-1]) for match in matches]
+
+    frames = indices(FRAME_PATTERN)
+    slices = indices(SLICE_PATTERN)
+    if frames is None and slices is None:
+        # A file per frame, in the order of names:
+        return [[p] for _, p in sorted(zip(map(natural_key, names), paths))]
+    frames = frames or [0] * len(paths)
+    slices = slices or [0] * len(paths)
+    grid = dict(zip(zip(frames, slices), paths))
+    frame_ids = sorted(set(frames))
+    slice_ids = sorted(set(slices))
+    if len(grid) != len(paths) or \
+            len(grid) != len(frame_ids) * len(slice_ids):
+        raise ValueError("Incomplete or ambiguous series of files in "
+                         "{}".format(path))
+    return [[grid[(t, z)] for z in slice_ids] for t in frame_ids]
+
+
+class LazyStack(object):
+    """Read-only 4D array-like (frame, slice, height, width) reading planes
+    on demand.
+
+    Supports the subset of numpy indexing used by the application: integers,
+    slices and integer arrays along frame and slice axes, any basic indexing
+    of the image plane. Subclasses define `shape`, `dtype` and
+    `plane(frame, z)`, which returns a 2D plane (height, width).
+
+    """
+
+    ndim = 4
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (4 - len(key))
+        frames = np.arange(self.shape[0])[key[0]]
+        slices = np.arange(self.shape[1])[key[1]]
+        planes = [self.plane(f, z)[key[2:]]
+                  for f in np.ravel(frames) for z in np.ravel(slices)]
+        out = np.array(planes, self.dtype)
+        return out.reshape(np.shape(frames) + np.shape(slices) +
+                           out.shape[1:])
+
+    def __array__(self, dtype=None, copy=None):
+        out = self[:, :]
+        if dtype is not None:
+            out = out.astype(dtype, copy=False)
+        return out
+
+
+class TiffStack(LazyStack):
+    """4D view of a channel of a TIFF file that decodes pages on demand."""
+
+    def __init__(self, path, channel=0):
+        import tifffile
+        self.path = path
+        self._tif = tifffile.TiffFile(path)
+        series = self._tif.series[0]
+        self._pages = series.pages
+        self.dtype = np.dtype(series.dtype)
+        axes = stack_axes(series.shape, series.axes)
+        nframes, nslices, nchannels, h, w = as_5d_shape(series.shape, axes)
+        if not 0 <= channel < nchannels:
+            self._tif.close()
+            raise IndexError("No channel {} in {}".format(channel, path))
+        self.shape = (nframes, nslices, h, w)
+        self.nchannels = nchannels
+        self.channel = channel
+        # Steps between planes of consecutive frames, slices and channels in
+        # the file:
+        sizes = dict(zip(axes, series.shape))
+        steps = {}
+        nplanes = 1
+        for axis in reversed(axes[:-2]):
+            steps[axis] = nplanes
+            nplanes *= sizes[axis]
+        self._steps = [steps.get(axis, 0) for axis in AXES[:3]]
+        # Number of planes stored in a single page:
+        self._planes_per_page = max(1, nplanes // len(self._pages))
+        # Last decoded page (pages may hold several planes):
+        self._page_index = None
+        self._page_data = None
+        # Planes may be requested from several threads: reads of the file
+        # (seek and read) are serialized, pages are decoded concurrently:
+        self._read_lock = threading.RLock()
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._read_lock:
+            self._tif.close()
+        self._page_data = None
+
+    def plane(self, frame, z):
+        step_frame, step_slice, step_channel = self._steps
+        index = frame*step_frame + z*step_slice + self.channel*step_channel
+        page_index, sub_index = divmod(index, self._planes_per_page)
+        with self._lock:
+            if page_index == self._page_index:
+                return self._page_data[sub_index]
+        with self._read_lock:
+            page = self._pages[page_index]
+        data = page.asarray(lock=self._read_lock)
+        data = data.reshape((-1,) + self.shape[-2:])
+        with self._lock:
+            self._page_index = page_index
+            self._page_data = data
+        return data[sub_index]
+
+
+class FileSeries(LazyStack):
+    """4D view of a channel of a series of TIFF files (see series_files).
+
+    Files hold images of the same shape, their frames and slices follow
+    each other. Only the first file is read when the series is opened,
+    files are opened when their planes are read and at most `max_open` are
+    kept open (least recently used are closed first, never while they are
+    read). Offsets of the data of
+    uncompressed files are kept, to memory-map them again without parsing.
+
+    """
+
+    def __init__(self, path, channel=0, max_open=MAX_OPEN_FILES):
+        import tifffile
+        self.path = path
+        self.files = series_files(path)
+        self.max_open = max_open
+        with tifffile.TiffFile(self.files[0][0]) as tif:
+            series = tif.series[0]
+            self._file_shape = series.shape
+            self._axes = stack_axes(series.shape, series.axes)
+            self.dtype = np.dtype(series.dtype)
+        nframes, nslices, nchannels, h, w = as_5d_shape(self._file_shape,
+                                                        self._axes)
+        if not 0 <= channel < nchannels:
+            raise IndexError("No channel {} in {}".format(channel, path))
+        # Frames and slices of a file:
+        self._file_planes = (nframes, nslices)
+        self.shape = (len(self.files) * nframes, len(self.files[0]) * nslices,
+                      h, w)
+        self.nchannels = nchannels
+        self.channel = channel
+        # Open files (path -> 4D view) and offsets of their data (path ->
+        # (offset, dtype), None for data that can not be memory-mapped):
+        self._open = collections.OrderedDict()
+        self._offsets = {}
+        # Number of reads in progress of open files (path -> count):
+        self._readers = {}
+        # (held for the bookkeeping of open files only, files are opened and
+        # read outside)
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            for image in self._open.values():
+                if hasattr(image, "close"):
+                    image.close()
+            self._open.clear()
+
+    def _open_file(self, path):
+        """Return the 4D view of the channel of a file of the series."""
+        if path not in self._offsets:
+            import tifffile
+            with tifffile.TiffFile(path) as tif:
+                series = tif.series[0]
+                if tuple(series.shape) != tuple(self._file_shape):
+                    raise ValueError("Shape of {} differs from the series"
+                                     .format(path))
+                offset = series.dataoffset
+                self._offsets[path] = None if offset is None else \
+                    (offset, tif.byteorder + series.dtype.char)
+        if self._offsets[path] is None:
+            return TiffStack(path, self.channel)
+        offset, dtype = self._offsets[path]
+        img = np.memmap(path, dtype, "r", offset, self._file_shape)
+        return channel_view(img, self._axes, self.channel)
+
+    def _acquire(self, path):
+        """Return the open view of a file, kept open until released."""
+        with self._lock:
+            image = self._open.pop(path, None)
+            if image is not None:
+                # (most recently used last)
+                self._open[path] = image
+                self._readers[path] = self._readers.get(path, 0) + 1
+                return image
+        image = self._open_file(path)
+        with self._lock:
+            if path in self._open:
+                # Opened by another thread in the meantime:
+                opened, image = image, self._open[path]
+                if hasattr(opened, "close"):
+                    opened.close()
+            else:
+                self._open[path] = image
+            self._readers[path] = self._readers.get(path, 0) + 1
+            self._close_unused()
+        return image
+
+    def _release(self, path):
+        with self._lock:
+            self._readers[path] -= 1
+            if self._readers[path] == 0:
+                del self._readers[path]
+            self._close_unused()
+
+    def _close_unused(self):
+        """Close least recently used files not being read (lock held)."""
+        unused = [path for path in self._open if path not in self._readers]
+        for path in unused[:max(0, len(self._open) - self.max_open)]:
+            closed = self._open.pop(path)
+            if hasattr(closed, "close"):
+                closed.close()
+
+    def plane(self, frame, z):
+        nframes, nslices = self._file_planes
+        path = self.files[frame // nframes][z // nslices]
+        image = self._acquire(path)
+        try:
+            return np.array(image[frame % nframes, z % nslices])
+        finally:
+            self._release(path)
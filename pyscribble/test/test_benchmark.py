@@ -0,0 +1,25 @@
+import json
+import unittest
+
+from ..benchmark import run
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_run(self):
+        for compress in [False, True]:
+            operators = ["mean", "max"] if compress else ["mean"]
+            report = run([2], [3], [64], [5], npoints=10, compress=compress,
+                         repeat=1, radius=2 if compress else 0,
+                         operators=operators, threads=2 if compress else 1)
+            stages = [res["stage"] for res in report["results"]]
+            self.assertEqual(stages, ["read_image"] +
+                             ["project"] * 3 * len(operators) +
+                             ["intensity_stats", "display", "rasterize",
+                              "write_mask"])
+            # Report is serializable:
+            json.dumps(report)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+import numpy as np
+import tifffile
+
+from ..core import read_image
+from ..core import save_mask_file
+from ..masks import LiveMask
+from ..scribbles import ScribbleStore
+
+
+class TestCore(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_headless_import(self):
+        # Neither Qt nor tifffile are imported with the core:
+        code = ("import sys, pyscribble.core; "
+                "print(sorted(m for m in ('PyQt4', 'tifffile') "
+                "if m in sys.modules))")
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        out = subprocess.check_output([sys.executable, "-c", code], cwd=root)
+        self.assertEqual(out.decode().strip(), "[]")
+
+    def test_read_and_save(self):
+        path = os.path.join(self.folder, "image.tif")
+        data = np.arange(2*3*8*8, dtype=np.uint16).reshape(2, 3, 8, 8)
+        tifffile.imwrite(path, data, photometric="minisblack")
+        image = read_image(path)
+        self.assertEqual(image.shape, data.shape)
+        self.assertTrue(np.array_equal(np.asarray(image[1, 2]), data[1, 2]))
+        scribbles = ScribbleStore()
+        stroke_id = scribbles.add([[1, 1], [1, 6]], (0, 3))
+        mask = LiveMask(data.shape[1:])
+        mask.add(stroke_id, scribbles.strokes[stroke_id])
+        path_mask = os.path.join(self.folder, "mask.tif")
+        save_mask_file(path_mask, mask)
+        self.assertEqual(np.count_nonzero(tifffile.imread(path_mask)), 3*6)
+        del image
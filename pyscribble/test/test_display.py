@@ -0,0 +1,80 @@
+import unittest
+import numpy as np
+
+from ..display import DisplayMapper
+from ..display import composite
+from ..display import intensity_stats
+from ..display import normalize
+
+
+class TestDisplay(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.image = rng.randint(10, 1000, (2, 3, 8, 9)).astype(np.uint16)
+
+    def test_stats_uint16(self):
+        stats = intensity_stats(self.image)
+        self.assertEqual(stats.vmin, self.image.min())
+        self.assertEqual(stats.vmax, self.image.max())
+        self.assertTrue(np.array_equal(stats.frame_max,
+                                       self.image.max(axis=(1, 2, 3))))
+        self.assertEqual(stats.hist.sum(), self.image.size)
+        self.assertEqual(stats.limits(), (self.image.min(), self.image.max()))
+
+    def test_stats_float(self):
+        image = np.float64(self.image)
+        stats = intensity_stats(image)
+        self.assertEqual(stats.limits(), (image.min(), image.max()))
+        vmin, vmax = stats.limits(1., 99.)
+        self.assertTrue(image.min() < vmin < vmax < image.max())
+
+    def test_stats_frames(self):
+        fractions = []
+        stats = intensity_stats(self.image, frames=[1],
+                                progress=fractions.append)
+        self.assertEqual(stats.vmax, self.image[1].max())
+        self.assertEqual(stats.hist.sum(), self.image[1].size)
+        self.assertEqual(fractions[-1], 1.)
+
+    def test_percentile_limits(self):
+        image = np.zeros((1, 1, 10, 10), np.uint8)
+        image[0, 0, 0, 0] = 255
+        image[0, 0, 1:] = 100
+        stats = intensity_stats(image)
+        self.assertEqual(stats.limits(5., 95.), (0, 100))
+
+    def test_lut_same_as_normalize(self):
+        plane = self.image[1, 2]
+        mapper = DisplayMapper(self.image.min(), self.image.max(), np.uint16)
+        self.assertIsNotNone(mapper.lut)
+        res = normalize(plane, self.image.min(), self.image.max())
+        self.assertTrue(np.array_equal(mapper(plane), res))
+
+    def test_float_into_buffer(self):
+        plane = np.float64(self.image[0, 0])
+        mapper = DisplayMapper(100., 500., np.float64)
+        out = np.empty(plane.shape, np.uint8)
+        res = mapper(plane, out)
+        self.assertIs(res, out)
+        res_ = normalize(np.clip(plane, 100., 500.), 100., 500.)
+        self.assertTrue(np.abs(np.int16(res) - res_).max() <= 1)
+
+    def test_composite(self):
+        green = np.array([[0, 100, 255]], np.uint8)
+        magenta = np.array([[200, 100, 0]], np.uint8)
+        rgb = composite([green, magenta])
+        self.assertEqual(rgb.dtype, np.uint32)
+        self.assertEqual([hex(v) for v in rgb.ravel()],
+                         ["0xffc800c8", "0xff646464", "0xff00ff00"])
+        # Saturated sums and partial colors:
+        rgb = composite([green, green], [(255, 0, 0), (255, 128, 0)])
+        self.assertEqual(hex(rgb[0, 2]), "0xffff8000")
+        # Into a buffer:
+        out = np.zeros((1, 3), np.uint32)
+        self.assertIs(composite([green, magenta], out=out), out)
+        self.assertEqual(hex(out[0, 0]), "0xffc800c8")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from ..instrument import LatencyHistogram
+from ..instrument import RECORDER
+from ..instrument import timed
+
+
+@timed("double")
+def double(x):
+    return 2*x
+
+
+class TestInstrument(unittest.TestCase):
+
+    def tearDown(self):
+        RECORDER.enabled = False
+        RECORDER.latencies = {}
+        RECORDER.gauges = {}
+
+    def test_histogram(self):
+        hist = LatencyHistogram()
+        hist.add(5e-5)
+        hist.add(0.15)
+        self.assertEqual(hist.count, 2)
+        self.assertEqual(hist.max, 0.15)
+        self.assertEqual(hist.bins[0], 1)
+        self.assertEqual(sum(hist.bins), 2)
+
+    def test_disabled(self):
+        self.assertEqual(double(2), 4)
+        self.assertEqual(RECORDER.latencies, {})
+
+    def test_enabled(self):
+        RECORDER.enabled = True
+        double(1)
+        double(2)
+        RECORDER.gauge("scene_items", 3)
+        self.assertEqual(RECORDER.latencies["double"].count, 2)
+        self.assertEqual(len(RECORDER.summary()), 2)
+        folder = tempfile.mkdtemp()
+        try:
+            path = os.path.join(folder, "profile.json")
+            RECORDER.dump(path)
+            with open(path) as f:
+                report = json.load(f)
+        finally:
+            shutil.rmtree(folder)
+        self.assertEqual(report["latencies"]["double"]["count"], 2)
+        self.assertEqual(report["gauges"]["scene_items"], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
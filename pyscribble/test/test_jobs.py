@@ -0,0 +1,85 @@
+import threading
+import unittest
+
+from ..jobs import Job
+from ..jobs import JobQueue
+
+
+class TestJobs(unittest.TestCase):
+
+    def test_result(self):
+        def func(progress):
+            progress(0.5)
+            progress(2.)
+            return 42
+        job = Job(func)
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.result, 42)
+        self.assertEqual(job.progress, 1.)
+        self.assertIsNone(job.error)
+
+    def test_error(self):
+        def func(progress):
+            raise ValueError("bad")
+        job = Job(func)
+        self.assertTrue(job.wait(5))
+        self.assertIsInstance(job.error, ValueError)
+
+    def test_cancel(self):
+        started = threading.Event()
+        steps = []
+
+        def func(progress):
+            started.set()
+            while True:
+                progress(0.)
+                steps.append(None)
+        job = Job(func)
+        started.wait(5)
+        job.cancel()
+        self.assertTrue(job.wait(5))
+        self.assertTrue(job.cancelled)
+        self.assertIsNone(job.result)
+        self.assertIsNone(job.error)
+
+    def test_queue(self):
+        queue = JobQueue()
+        order = []
+        release = threading.Event()
+
+        def first(progress):
+            release.wait(5)
+            order.append(1)
+            return 1
+        queue.submit(first, "first", done=order.append)
+        queue.submit(lambda progress: order.append(2) or 2, "second")
+        # One job at a time:
+        self.assertEqual(len(queue), 2)
+        self.assertIsNone(queue.poll())
+        release.set()
+        queue.job.wait(5)
+        job, done = queue.poll()
+        self.assertEqual((job.name, job.result, done), ("first", 1,
+                                                       order.append))
+        queue.wait()
+        self.assertEqual(order, [1, 2])
+        self.assertEqual(len(queue), 0)
+
+    def test_queue_clear(self):
+        queue = JobQueue()
+        started = threading.Event()
+
+        def func(progress):
+            started.set()
+            while True:
+                progress(0.)
+        queue.submit(func)
+        queue.submit(func)
+        started.wait(5)
+        queue.clear()
+        self.assertEqual(len(queue), 0)
+        self.assertIsNone(queue.poll())
+
+
+if __name__ == '__main__':
+    unittest.main()
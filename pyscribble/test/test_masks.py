@@ -0,0 +1,168 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import tifffile
+
+from ..masks import LiveMask
+from ..masks import SparseMask
+from ..masks import read_runs
+from ..masks import render_mask
+from ..masks import render_sparse_mask
+from ..masks import write_mask
+from ..masks import write_runs
+from ..raster import rasterize_scribbles
+from ..scribbles import ScribbleStore
+
+
+class TestMasks(unittest.TestCase):
+
+    def setUp(self):
+        self.shape = (3, 40, 300)
+        self.scribbles = ScribbleStore()
+        self.scribbles.add([(1, 1), (30, 250), (5, 290)], (0, 3))
+        self.scribbles.add([(20, 0), (20, 299)], (1, 2))
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_sparse_same_as_dense(self):
+        mask = render_mask(self.scribbles, self.shape)
+        sparse = render_sparse_mask(self.scribbles, self.shape)
+        self.assertEqual(len(sparse), np.count_nonzero(mask))
+        self.assertTrue(np.array_equal(sparse.dense(), mask))
+        for z in range(self.shape[0]):
+            self.assertTrue(np.array_equal(sparse.plane(z), mask[z]))
+
+    def test_live_same_as_rendered(self):
+        live = LiveMask(self.shape)
+        for stroke_id, stroke in self.scribbles.strokes.items():
+            live.add(stroke_id, stroke)
+        # Polylines drawn at every slice of their strokes:
+        nslices = self.shape[0]
+        scribbles = [[(z,) + tuple(p) for p in stroke.points]
+                     for stroke in self.scribbles.strokes.values()
+                     for z in range(max(stroke.slices[0], 0),
+                                    min(stroke.slices[1], nslices))]
+        mask = rasterize_scribbles(scribbles, self.shape)
+        sparse = live.sparse()
+        self.assertTrue(np.array_equal(sparse.index, render_sparse_mask(
+            self.scribbles, self.shape).index))
+        for z in range(self.shape[0]):
+            self.assertTrue(np.array_equal(live.plane(z), mask[z]))
+        self.assertTrue(np.array_equal(live.plane(), mask.max(axis=0)))
+
+    def test_live_brush_and_fill(self):
+        self.scribbles.add([(5.5, 5.5), (5.5, 20.5)], (2, 3), radius=3)
+        self.scribbles.add([(10.5, 100.5), (30.5, 100.5), (30.5, 120.5)],
+                           (0, 1), fill=True)
+        mask = render_mask(self.scribbles, self.shape)
+        self.assertEqual(mask[2, 2:9, 5].tolist(), [255] * 7)
+        self.assertEqual(mask[2, 9, 5], 0)
+        self.assertEqual(mask[0, 25, 105], 255)
+        self.assertEqual(mask[0, 15, 115], 0)
+
+    def test_labels(self):
+        self.scribbles.add([(20, 10), (20, 20)], (1, 2), label=3)
+        sparse = render_sparse_mask(self.scribbles, self.shape)
+        plane = LiveMask.from_scribbles(self.scribbles, self.shape).plane(1)
+        self.assertTrue(np.array_equal(sparse.plane(1), plane))
+        self.assertEqual(sparse.dtype, np.uint8)
+        # Pixels take the label of the last stroke:
+        self.assertEqual(plane[20, 5:25].tolist(), [255]*5 + [3]*11 + [255]*4)
+        # Single label:
+        binary = render_mask(self.scribbles, self.shape, value=1)
+        self.assertEqual(binary.max(), 1)
+        self.assertTrue(np.array_equal(binary > 0, sparse.dense() > 0))
+
+    def test_labels_uint16(self):
+        self.scribbles.add([(20, 10), (20, 20)], (1, 2), label=300)
+        sparse = render_sparse_mask(self.scribbles, self.shape)
+        self.assertEqual(sparse.dtype, np.uint16)
+        self.assertEqual(sorted(set(sparse.values)), [255, 300])
+        path = os.path.join(self.folder, "mask.tif")
+        write_mask(path, sparse)
+        mask = tifffile.imread(path)
+        self.assertEqual(mask.dtype, np.uint16)
+        self.assertEqual(mask[1, 20, 15], 300)
+
+    def test_live_remove(self):
+        live = LiveMask.from_scribbles(self.scribbles, self.shape)
+        live.remove(0)
+        self.assertEqual(len(live), 1)
+        self.assertEqual(np.count_nonzero(live.plane(0)), 0)
+        self.assertEqual(len(live.sparse()), 300)
+        live.remove(1)
+        self.assertEqual(len(live.sparse()), 0)
+
+    def test_live_restore(self):
+        live = LiveMask.from_scribbles(self.scribbles, self.shape)
+        sparse = live.sparse()
+        pixels = live.remove(0)
+        live.restore(0, pixels)
+        self.assertEqual(list(live.pixels), [0, 1])
+        restored = live.sparse()
+        self.assertTrue(np.array_equal(restored.index, sparse.index))
+        self.assertTrue(np.array_equal(restored.values, sparse.values))
+
+    def test_strokes_at(self):
+        live = LiveMask.from_scribbles(self.scribbles, self.shape)
+        w = self.shape[-1]
+        # The horizontal line (slice 1 only) and a pixel of no stroke:
+        self.assertEqual(live.strokes_at([20*w + 100, 39*w]), [1])
+        self.assertEqual(live.strokes_at([20*w + 100], z=0), [])
+        # Both strokes (at their crossing):
+        index = np.flatnonzero(live.plane(1) > 0)
+        self.assertEqual(live.strokes_at(index, z=1), [0, 1])
+        self.assertEqual(live.strokes_at([]), [])
+        # Only candidate strokes are tested:
+        self.assertEqual(live.strokes_at(index, z=1, stroke_ids=set([1])),
+                         [1])
+        self.assertEqual(live.strokes_at(index, stroke_ids=[1, 0, 7]),
+                         [0, 1])
+
+    def test_labels_at(self):
+        self.scribbles.add([(0, 100), (39, 100)], (0, 3), label=2)
+        live = LiveMask.from_scribbles(self.scribbles, self.shape)
+        index = np.arange(self.shape[1]*self.shape[2])
+        for z in [0, 1, None]:
+            # Same labels as the plane, including the crossings:
+            self.assertTrue(np.array_equal(live.labels_at(index, z),
+                                           live.plane(z).ravel()))
+        self.assertEqual(len(live.labels_at([])), 0)
+
+    def test_live_copy(self):
+        live = LiveMask.from_scribbles(self.scribbles, self.shape)
+        snapshot = live.copy()
+        live.remove(0)
+        self.assertEqual(len(snapshot), 2)
+
+    def test_runs(self):
+        sparse = render_sparse_mask(self.scribbles, self.shape)
+        runs, values = sparse.runs()
+        # The horizontal line is a single run:
+        self.assertIn([1, 20, 0, 300], runs.tolist())
+        sparse_ = SparseMask.from_runs(self.shape, runs, values)
+        self.assertTrue(np.array_equal(sparse_.index, sparse.index))
+        path = os.path.join(self.folder, "mask.npz")
+        write_runs(path, sparse)
+        self.assertTrue(np.array_equal(read_runs(path).dense(),
+                                       sparse.dense()))
+
+    def test_write_mask(self):
+        sparse = render_sparse_mask(self.scribbles, self.shape)
+        path = os.path.join(self.folder, "mask.tif")
+        write_mask(path, sparse)
+        with tifffile.TiffFile(path) as tif:
+            self.assertTrue(tif.pages[0].is_tiled)
+            self.assertTrue(np.array_equal(tif.asarray(), sparse.dense()))
+        fractions = []
+        write_mask(path, sparse.dense(), progress=fractions.append)
+        self.assertTrue(np.array_equal(tifffile.imread(path), sparse.dense()))
+        self.assertEqual(fractions, [0., 1./3, 2./3, 1.])
+
+
+if __name__ == '__main__':
+    unittest.main()
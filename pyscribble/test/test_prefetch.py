@@ -0,0 +1,66 @@
+import time
+import unittest
+import numpy as np
+
+from ..prefetch import PlanePrefetcher
+
+
+class Converter(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, plane):
+        self.calls.append(plane[0, 0])
+        return np.uint8(plane)
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def setUp(self):
+        self.image = np.arange(10*3).reshape(10, 3, 1, 1)
+        self.prefetcher = PlanePrefetcher(depth=2)
+
+    def tearDown(self):
+        self.prefetcher.close()
+
+    def wait(self, keys):
+        for _ in range(100):
+            if all(key in self.prefetcher._cache for key in keys):
+                return True
+            time.sleep(0.01)
+        return False
+
+    def test_get(self):
+        self.prefetcher.set_source(self.image, Converter())
+        plane = self.prefetcher.get(4, 1)
+        self.assertTrue(np.array_equal(plane, self.image[4, 1]))
+
+    def test_get_into_buffer(self):
+        self.prefetcher.set_source(self.image, Converter())
+        out = np.zeros((1, 1), np.uint8)
+        for _ in range(2):
+            # (converted, then cached)
+            self.assertIs(self.prefetcher.get(4, 1, out), out)
+            self.assertTrue(np.array_equal(out, self.image[4, 1]))
+        self.assertIsNot(self.prefetcher._cache[(4, 1)], out)
+
+    def test_prefetch_in_direction_of_move(self):
+        self.prefetcher.set_source(self.image, Converter())
+        self.prefetcher.get(0, 1)
+        self.prefetcher.get(2, 1)
+        # Frames 4 and 6 are prepared in the background:
+        self.assertTrue(self.wait([(4, 1), (6, 1)]))
+        plane = self.prefetcher._cache[(4, 1)]
+        self.assertIs(self.prefetcher.get(4, 1), plane)
+
+    def test_new_source_drops_planes(self):
+        self.prefetcher.set_source(self.image, Converter())
+        self.prefetcher.get(0, 0)
+        self.prefetcher.set_source(self.image + 1, Converter())
+        self.assertTrue(np.array_equal(self.prefetcher.get(0, 0),
+                                       self.image[0, 0] + 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
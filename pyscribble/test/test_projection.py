@@ -0,0 +1,110 @@
+import unittest
+import numpy as np
+
+from ..projection import MAX
+from ..projection import MEAN
+from ..projection import MIN
+from ..projection import STD
+from ..projection import ProjectionCache
+from ..projection import project
+from ..projection import sum_dtype
+
+
+class TestProjection(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.image = rng.randint(0, 1000, (3, 5, 4, 6)).astype(np.uint16)
+
+    def test_project_mean(self):
+        for frame in [False, True]:
+            for slice_ in [False, True]:
+                img = np.float64(self.image)
+                if frame:
+                    img = img.mean(axis=0, keepdims=True)
+                if slice_:
+                    img = img.mean(axis=1, keepdims=True)
+                res = project(self.image, frame, slice_, chunk_size=2)
+                self.assertEqual(res.shape, img.shape)
+                self.assertTrue(np.allclose(res, img))
+
+    def test_project_operators(self):
+        reference = {MAX: np.max, MIN: np.min, STD: np.std}
+        # Float images are not modified (even read-only ones):
+        image_float = np.float64(self.image)
+        image_float.flags.writeable = False
+        for image in [self.image, image_float]:
+            for operator, func in reference.items():
+                for frame, slice_ in [(True, False), (False, True),
+                                      (True, True)]:
+                    axis = (0,) * frame + (1,) * slice_
+                    img = func(np.float64(image), axis=axis, keepdims=True)
+                    for threads in [1, 3]:
+                        res = project(image, frame, slice_, chunk_size=2,
+                                      operator=operator, threads=threads)
+                        self.assertEqual(res.shape, img.shape)
+                        self.assertTrue(np.allclose(res, img, rtol=1e-5))
+                        if operator != STD:
+                            # (kept in the dtype of the image)
+                            self.assertEqual(res.dtype, image.dtype)
+        self.assertTrue(np.array_equal(image_float, self.image))
+
+    def test_project_threads(self):
+        res = project(self.image, True, False, chunk_size=2, threads=4)
+        self.assertTrue(np.allclose(res, np.mean(self.image, axis=0,
+                                                 keepdims=True)))
+
+    def test_project_dtypes(self):
+        for operator in [MEAN, STD]:
+            res = project(self.image, True, True, operator=operator)
+            self.assertEqual(res.dtype, np.float32)
+        # Large offsets do not lose the standard deviation:
+        image = np.float32(self.image) + 1e6
+        res = project(image, True, True, chunk_size=2, operator=STD)
+        self.assertTrue(np.allclose(res, np.std(np.float64(image), axis=(0, 1),
+                                                keepdims=True), rtol=1e-4))
+
+    def test_sum_dtype(self):
+        self.assertEqual(sum_dtype(np.uint8, 100), np.uint16)
+        self.assertEqual(sum_dtype(np.uint8, 1000), np.uint32)
+        self.assertEqual(sum_dtype(np.uint16, 1000), np.uint32)
+        self.assertEqual(sum_dtype(np.int16, 10**6), np.int64)
+        self.assertEqual(sum_dtype(np.float64, 10), np.float64)
+        self.assertEqual(sum_dtype(np.float16, 10), np.float32)
+
+    def test_no_projection_returns_image(self):
+        self.assertIs(project(self.image), self.image)
+        # Projections of a single frame or slice:
+        image = self.image[:1, :1]
+        for operator in [MEAN, MAX, STD]:
+            self.assertIs(project(image, True, True, operator=operator),
+                          image)
+        cache = ProjectionCache(self.image[:, :1])
+        self.assertIs(cache.get((False, True, MAX)), cache.image)
+
+    def test_cache(self):
+        # (room for a single projection over frames)
+        cache = ProjectionCache(self.image, maxbytes=5*4*6*4)
+        res = cache.get((True, False))
+        self.assertIs(cache.get((True, False)), res)
+        cache.get((False, True))
+        # Bounded size, the least recently used projection is dropped:
+        self.assertIsNot(cache.get((True, False)), res)
+
+    def test_cache_operators(self):
+        cache = ProjectionCache(self.image)
+        # Mean by default:
+        self.assertIs(cache.get((True, False, MEAN)), cache.get((True, False)))
+        self.assertTrue(np.array_equal(cache.get((True, False, MAX)),
+                                       self.image.max(axis=0, keepdims=True)))
+
+    def test_prefetch(self):
+        cache = ProjectionCache(self.image)
+        cache.prefetch([(True, True)]).join()
+        self.assertIn((True, True, MEAN), cache._cache)
+        cache.close()
+        self.assertEqual(len(cache._cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,33 @@
 import unittest
 import numpy as np
 
-from ..main import line_pass_square
-from ..main import line_pass_two_points_2d
-from ..main import pixel_centers_2d
+from ..core import line_pass_square
+from ..core import line_pass_two_points_2d
+from ..core import pixel_centers_2d
+from ..raster import fill_polygon
+from ..raster import rasterize_scribbles
+from ..raster import rasterize_segments
+from ..raster import scribbles_to_segments
+from ..raster import segment_cells
+from ..raster import stroke_pixels
+
+
+def rasterize_reference(scribbles, shape):
+    """Rasterize scribbles testing every pixel with line_pass_square."""
+    mask = np.zeros(shape, np.uint8)
+    for ps, pe in scribbles_to_segments(scribbles, shape):
+        zs, ys, xs = ps
+        ze, ye, xe = pe
+        param = line_pass_two_points_2d(ps, pe)
+        pixel_centers = pixel_centers_2d(ys, ye, xs, xe)
+        if len(pixel_centers) == 1:
+            mask[zs, ys, xs] = 255
+            continue
+        for px in pixel_centers:
+            if line_pass_square(px, param):
+                y_, x_ = np.int64(px)
+                mask[zs, y_, x_] = 255
+    return mask
 
 
 class TestMain(unittest.TestCase):
@@ -48,5 +72,118 @@ class TestMain(unittest.TestCase):
         arr_ = np.array([[0, 3], [0, 2], [0, 1], [0, 0]])
         self.assertTrue(np.allclose(arr, arr_))
 
+
+class TestRaster(unittest.TestCase):
+
+    def assert_same_as_reference(self, scribbles, shape):
+        mask = rasterize_scribbles(scribbles, shape)
+        mask_ = rasterize_reference(scribbles, shape)
+        self.assertTrue(np.array_equal(mask, mask_))
+
+    def test_all_segments_in_small_grid(self):
+        shape = (1, 5, 5)
+        for ys in range(5):
+            for xs in range(5):
+                for ye in range(5):
+                    for xe in range(5):
+                        scribble = [(0, ys, xs), (0, ye, xe)]
+                        self.assert_same_as_reference([scribble], shape)
+
+    def test_random_scribbles(self):
+        rng = np.random.RandomState(0)
+        shape = (3, 40, 50)
+        for _ in range(100):
+            scribbles = []
+            for _ in range(rng.randint(1, 4)):
+                z = rng.randint(0, 3)
+                # Some points fall outside of the mask on purpose:
+                scribbles.append([(z, rng.uniform(-3, 43), rng.uniform(-3, 53))
+                                  for _ in range(rng.randint(1, 6))])
+            self.assert_same_as_reference(scribbles, shape)
+
+    def test_segment_cells(self):
+        rng = np.random.RandomState(1)
+        segments = rng.randint(0, 30, (50, 2, 2))
+        # Lines through vertices and along edges of pixels (ties):
+        segments[:3] = [[[0, 0], [9, 9]], [[2, 0], [2, 12]], [[0, 3], [6, 0]]]
+        cells, index = segment_cells(segments)
+        for i, (ps, pe) in enumerate(segments):
+            param = line_pass_two_points_2d(ps, pe)
+            expected = set(tuple(np.int64(px)) for px in pixel_centers_2d(
+                ps[0], pe[0], ps[1], pe[1]) if line_pass_square(px, param))
+            if np.all(ps == pe):
+                expected = set([tuple(ps)])
+            self.assertEqual(set(map(tuple, cells[index == i])), expected)
+        # Output proportional to the length of segments (not their area):
+        length = np.abs(segments[:, 1] - segments[:, 0]).max(axis=1) + 1
+        self.assertLessEqual(len(cells), 2*length.sum())
+
+    def test_degenerate_segment(self):
+        px = rasterize_segments([[[1, 4, 7], [1, 4, 7]]])
+        self.assertTrue(np.array_equal(px, [[1, 4, 7]]))
+
+    def test_single_point_scribble(self):
+        mask = rasterize_scribbles([[(0, 2.5, 2.5)]], (1, 5, 5))
+        self.assertFalse(mask.any())
+
+    def test_long_diagonal(self):
+        px = rasterize_segments([[[0, 0, 0], [0, 1000, 1000]]])
+        self.assertEqual(len(px), 1001)
+        self.assertTrue(np.array_equal(px[:, 1], px[:, 2]))
+
+    def test_stroke_pixels_line(self):
+        rng = np.random.RandomState(0)
+        shape = (30, 40)
+        for _ in range(20):
+            points = rng.uniform(0, shape, (5, 2))
+            mask = rasterize_scribbles([[(0,) + tuple(p) for p in points]],
+                                       (1,) + shape)
+            self.assertTrue(np.array_equal(stroke_pixels(points, shape),
+                                           np.flatnonzero(mask)))
+
+    def test_brush(self):
+        rng = np.random.RandomState(1)
+        shape = (30, 40)
+        y, x = np.indices(shape).reshape(2, -1)
+        for radius in [0.5, 1, 2.5, 4, 7]:
+            points = rng.uniform(0, shape, (4, 2))
+            line = np.unravel_index(stroke_pixels(points, shape), shape)
+            # Pixels within radius of a pixel of the line:
+            dist2 = ((y[:, None] - line[0])**2 + (x[:, None] - line[1])**2)
+            expected = np.flatnonzero(dist2.min(axis=1) <= radius**2)
+            self.assertTrue(np.array_equal(
+                stroke_pixels(points, shape, radius), expected))
+
+    def test_fill_polygon(self):
+        rng = np.random.RandomState(2)
+        shape = (30, 40)
+        yc, xc = np.indices(shape) + 0.5
+        for i in range(50):
+            points = rng.uniform(0, shape, (rng.randint(3, 9), 2))
+            if i % 2:
+                # Vertices at pixel centers (ties with pixel centers):
+                points = np.floor(points) + 0.5
+            # Crossing number of rays from pixel centers towards +x:
+            inside = np.zeros(shape, bool)
+            y0, x0 = points.T
+            y1, x1 = np.roll(points, -1, axis=0).T
+            for k in range(len(points)):
+                if y0[k] == y1[k]:
+                    continue
+                cross = (y0[k] > yc) != (y1[k] > yc)
+                x = x0[k] + (yc - y0[k]) * (x1[k] - x0[k]) / (y1[k] - y0[k])
+                inside ^= cross & (x > xc)
+            self.assertTrue(np.array_equal(fill_polygon(points, shape),
+                                           inside))
+
+    def test_lasso_contains_outline(self):
+        shape = (30, 40)
+        points = [(2.5, 2.5), (25.5, 5.5), (10.5, 35.5)]
+        outline = stroke_pixels(points + points[:1], shape)
+        lasso = stroke_pixels(points, shape, fill=True)
+        self.assertTrue(np.all(np.isin(outline, lasso)))
+        self.assertIn(np.ravel_multi_index((12, 14), shape), lasso)
+
+
 if __name__ == '__main__':
     unittest.main()
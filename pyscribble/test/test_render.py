@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import tifffile
+
+from ..masks import render_mask
+from ..render import mask_path
+from ..render import render_files
+from ..scribbles import ScribbleStore
+from ..scribbles import save_scribbles
+
+
+class TestRender(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_mask_path(self):
+        self.assertEqual(mask_path("a/img-scribbles.npz"), "a/img-mask.tif")
+        self.assertEqual(mask_path("a/img.npz"), "a/img-mask.tif")
+
+    def test_render_files(self):
+        shape = (2, 20, 30)
+        paths, masks = [], []
+        for i in range(3):
+            scribbles = ScribbleStore()
+            scribbles.add([(1, 1), (15, 4 + i), (3, 25)], (0, 2))
+            scribbles.add([(5, 5), (6, 20)], (1, 2))
+            path = os.path.join(self.folder, "{}-scribbles.npz".format(i))
+            save_scribbles(path, scribbles, shape)
+            paths.append(path)
+            masks.append(render_mask(scribbles, shape))
+        lines = []
+        stats = render_files(paths, processes=2, log=lines.append)
+        self.assertEqual(stats["masks"], 3)
+        self.assertEqual(len(lines), 4)
+        for path, mask in zip(paths, masks):
+            self.assertTrue(np.array_equal(tifffile.imread(mask_path(path)),
+                                           mask))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from ..masks import render_mask
+from ..scribbles import ScribbleStore
+from ..scribbles import StrokeInput
+from ..scribbles import load_scribbles
+from ..scribbles import save_scribbles
+from ..scribbles import scribbles_path
+from ..scribbles import simplify
+
+
+class TestScribbleStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = ScribbleStore()
+        self.points = [(1.5, 2.5), (7.2, 3.1), (4., 9.)]
+        self.id_1 = self.store.add(self.points, (2, 3), label=2)
+        self.id_all = self.store.add(self.points[::-1], (0, 4), frame=1,
+                                     radius=2, fill=True)
+
+    def test_index_by_slice(self):
+        self.assertEqual(self.store.at_slice(2), set([self.id_1, self.id_all]))
+        self.assertEqual(self.store.at_slice(0), set([self.id_all]))
+        self.assertEqual(self.store.at_slice(5), set())
+
+    def test_remove(self):
+        stroke = self.store.remove(self.id_all)
+        self.assertEqual(stroke.frame, 1)
+        self.assertEqual(self.store.at_slice(0), set())
+        self.assertEqual(len(self.store), 1)
+
+    def test_undo_redo(self):
+        self.assertEqual(self.store.undo()[:1], (self.id_all,))
+        self.assertEqual(list(self.store), [self.id_1])
+        self.assertEqual(self.store.at_slice(0), set())
+        stroke_id, stroke, added = self.store.redo()
+        self.assertTrue(added)
+        self.assertEqual(list(self.store), [self.id_1, self.id_all])
+        self.assertIsNone(self.store.redo())
+        # A new change discards undone ones:
+        self.store.undo()
+        self.store.add(self.points, (1, 2))
+        self.assertIsNone(self.store.redo())
+
+    def test_undo_remove(self):
+        self.store.remove(self.id_1)
+        stroke_id, stroke, added = self.store.undo()
+        self.assertEqual((stroke_id, added), (self.id_1, False))
+        # The restored stroke is back before later strokes:
+        self.assertEqual(list(self.store), [self.id_1, self.id_all])
+        self.assertEqual(self.store.at_slice(2), set([self.id_1, self.id_all]))
+        self.store.redo()
+        self.assertEqual(list(self.store), [self.id_all])
+
+    def test_history_ids(self):
+        self.assertEqual(self.store.history_ids(),
+                         set([self.id_1, self.id_all]))
+        self.store.undo()
+        self.store.remove(self.id_1)
+        # (the undone addition cannot be redone anymore)
+        self.assertEqual(self.store.history_ids(), set([self.id_1]))
+        self.store.clear_history()
+        self.assertEqual(self.store.history_ids(), set())
+
+    def test_scribbles_path(self):
+        self.assertEqual(scribbles_path(os.path.join("a", "img.tif")),
+                         os.path.join("a", "img-scribbles.npz"))
+        # Series of files (directory or glob pattern):
+        self.assertEqual(scribbles_path(os.path.join("a", "run", "")),
+                         os.path.join("a", "run-scribbles.npz"))
+        # (not in the folder of a pattern, where files could match it)
+        self.assertEqual(scribbles_path(os.path.join("a", "b", "img_*.tif")),
+                         os.path.join("a", "img-scribbles.npz"))
+        self.assertEqual(scribbles_path(os.path.join("a", "b", "*.tif")),
+                         os.path.join("a", "b-scribbles.npz"))
+
+    def test_save_load(self):
+        folder = tempfile.mkdtemp()
+        try:
+            path = os.path.join(folder, "img-scribbles.npz")
+            save_scribbles(path, self.store, (4, 10, 12))
+            store, shape = load_scribbles(path)
+        finally:
+            shutil.rmtree(folder)
+        self.assertEqual(shape, (4, 10, 12))
+        self.assertEqual(len(store), 2)
+        for stroke, stroke_ in zip(self.store.strokes.values(),
+                                   store.strokes.values()):
+            self.assertTrue(np.array_equal(stroke.points, stroke_.points))
+            self.assertEqual(stroke.slices, stroke_.slices)
+            self.assertEqual(stroke.frame, stroke_.frame)
+            self.assertEqual(stroke.radius, stroke_.radius)
+            self.assertEqual(stroke.fill, stroke_.fill)
+            self.assertEqual(stroke.label, stroke_.label)
+        # Loaded strokes cannot be undone:
+        self.assertIsNone(store.undo())
+
+
+class TestStrokeInput(unittest.TestCase):
+
+    def test_snap_and_drop(self):
+        stroke = StrokeInput((10, 12))
+        self.assertEqual(stroke.add(1.2, 3.7), (1.5, 3.5))
+        self.assertIsNone(stroke.add(1.9, 3.1))
+        self.assertIsNone(stroke.add(-0.5, 3.))
+        self.assertIsNone(stroke.add(4., 12.))
+        self.assertEqual(stroke.add(2., 3.), (2.5, 3.5))
+        self.assertEqual(stroke.finish(None).tolist(), [[1.5, 3.5],
+                                                        [2.5, 3.5]])
+
+    def test_single_pixel(self):
+        stroke = StrokeInput((10, 12))
+        stroke.add(1.2, 3.7)
+        self.assertEqual(len(stroke.finish()), 1)
+        stroke.add(1.3, 3.6)
+        self.assertEqual(len(stroke.finish()), 2)
+
+    def test_same_mask(self):
+        rng = np.random.RandomState(0)
+        shape = (1, 30, 40)
+        for _ in range(100):
+            points = np.cumsum(rng.normal(0, 2, (30, 2)), axis=0) + (15, 20)
+            raw = ScribbleStore()
+            raw.add(points, (0, 1))
+            stroke = StrokeInput(shape)
+            [stroke.add(y, x) for y, x in points]
+            snapped = ScribbleStore()
+            points = stroke.finish()
+            if len(points):
+                snapped.add(points, (0, 1))
+            self.assertTrue(np.array_equal(render_mask(raw, shape),
+                                           render_mask(snapped, shape)))
+
+    def test_simplify(self):
+        points = np.array([(0, 0), (1, 1), (2, 2), (2, 3), (2, 5)], float)
+        self.assertEqual(simplify(points).tolist(),
+                         [[0, 0], [2, 2], [2, 5]])
+        self.assertEqual(simplify(points, 1.5).tolist(), [[0, 0], [2, 5]])
+
+
+if __name__ == '__main__':
+    unittest.main()
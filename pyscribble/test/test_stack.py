@@ -0,0 +1,168 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import tifffile
+from multiprocessing.pool import ThreadPool
+
+from ..stack import FileSeries
+from ..stack import TiffStack
+from ..stack import as_4d_shape
+from ..stack import count_channels
+from ..stack import is_series
+from ..stack import open_stack
+from ..stack import series_files
+from ..stack import stack_axes
+
+
+class TestStack(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.image = np.arange(2*3*4*5, dtype=np.uint16).reshape(2, 3, 4, 5)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, name, image, **kwargs):
+        path = os.path.join(self.folder, name)
+        tifffile.imwrite(path, image, photometric="minisblack", **kwargs)
+        return path
+
+    def test_as_4d_shape(self):
+        self.assertEqual(as_4d_shape((4, 5)), (1, 1, 4, 5))
+        self.assertEqual(as_4d_shape((3, 4, 5)), (1, 3, 4, 5))
+        self.assertRaises(Exception, as_4d_shape, (1, 2, 3, 4, 5))
+
+    def test_open_uncompressed_is_memmap(self):
+        img = open_stack(self.write("img.tif", self.image))
+        self.assertIsInstance(img, np.memmap)
+        self.assertEqual(img.dtype, np.uint16)
+        self.assertTrue(np.array_equal(img, self.image))
+
+    def test_open_compressed_is_lazy(self):
+        path = self.write("img.tif", self.image, compression="zlib")
+        img = open_stack(path)
+        self.assertIsInstance(img, TiffStack)
+        self.assertEqual(img.shape, self.image.shape)
+        self.assertEqual(img.dtype, np.uint16)
+        self.assertTrue(np.array_equal(img[1, 2], self.image[1, 2]))
+        self.assertTrue(np.array_equal(img[:, 1:], self.image[:, 1:]))
+        self.assertTrue(np.array_equal(img[0, :, 1:3, 2],
+                                       self.image[0, :, 1:3, 2]))
+        self.assertTrue(np.array_equal(np.asarray(img), self.image))
+        img.close()
+
+    def test_open_2d(self):
+        path = self.write("img.tif", self.image[0, 0], compression="zlib")
+        img = open_stack(path)
+        self.assertEqual(img.shape, (1, 1, 4, 5))
+        self.assertTrue(np.array_equal(img[0, 0], self.image[0, 0]))
+        img.close()
+
+    def test_stack_axes(self):
+        self.assertEqual(stack_axes((3, 4, 5), "ZCYX"), "ZYX")
+        self.assertEqual(stack_axes((2, 3, 4, 5), "ZCYX"), "ZCYX")
+        self.assertEqual(stack_axes((2, 3, 4, 5), "QQYX"), "TZYX")
+        self.assertRaises(Exception, stack_axes, (1, 2, 3, 4, 5, 6))
+
+    def test_channels(self):
+        image = np.arange(2*3*4*5*6, dtype=np.uint16).reshape(2, 3, 4, 5, 6)
+        for compression in [None, "zlib"]:
+            path = self.write("img.tif", image, imagej=True,
+                              metadata={"axes": "TZCYX"},
+                              compression=compression)
+            self.assertEqual(count_channels(path), 4)
+            for c in [0, 3]:
+                img = open_stack(path, c)
+                self.assertEqual(img.shape, (2, 3, 5, 6))
+                self.assertTrue(np.array_equal(img[1, 2], image[1, 2, c]))
+                self.assertTrue(np.array_equal(np.asarray(img),
+                                               image[:, :, c]))
+                if hasattr(img, "close"):
+                    img.close()
+
+    def test_channels_first(self):
+        # Channels before slices, without frames:
+        image = np.arange(4*3*5*6, dtype=np.uint8).reshape(4, 3, 5, 6)
+        for compression in [None, "zlib"]:
+            path = self.write("img.tif", image, compression=compression,
+                              metadata={"axes": "CZYX"})
+            self.assertEqual(count_channels(path), 4)
+            img = open_stack(path, 2)
+            self.assertEqual(img.shape, (1, 3, 5, 6))
+            self.assertTrue(np.array_equal(img[0, 1], image[2, 1]))
+            if hasattr(img, "close"):
+                img.close()
+            self.assertRaises(IndexError, open_stack, path, 4)
+
+    def test_series_grid(self):
+        # A file per frame and slice, in any order of names:
+        for f in range(2):
+            for z in range(3):
+                self.write("img_z{}_t{}.tif".format(z, f + 1),
+                           self.image[f, z])
+        path = os.path.join(self.folder, "img_*.tif")
+        self.assertEqual(len(series_files(path)), 2)
+        self.assertEqual(count_channels(path), 1)
+        img = open_stack(path)
+        self.assertIsInstance(img, FileSeries)
+        self.assertEqual(img.shape, self.image.shape)
+        self.assertTrue(np.array_equal(img[:, :], self.image))
+        self.assertTrue(np.array_equal(img[1, :, 1:3], self.image[1, :, 1:3]))
+        img.close()
+
+    def test_series_directory(self):
+        # A file (stack of slices) per frame, ordered by name:
+        self.write("f10.tif", self.image[1])
+        self.write("f2.tif", self.image[0], compression="zlib")
+        img = open_stack(self.folder)
+        self.assertEqual(img.shape, self.image.shape)
+        self.assertTrue(np.array_equal(np.asarray(img), self.image))
+
+    def test_series_open_files(self):
+        for f in range(2):
+            for z in range(3):
+                self.write("t{}z{}.tif".format(f, z), self.image[f, z])
+        img = FileSeries(self.folder, max_open=2)
+        for f in range(2):
+            for z in range(3):
+                self.assertTrue(np.array_equal(img[f, z], self.image[f, z]))
+                self.assertLessEqual(len(img._open), 2)
+        # Offsets of the data are kept to map files again:
+        self.assertEqual(len(img._offsets), 6)
+
+    def test_series_threads(self):
+        for f in range(2):
+            for z in range(3):
+                self.write("t{}z{}.tif".format(f, z), self.image[f, z],
+                           compression="zlib" if z % 2 else None)
+        img = FileSeries(self.folder, max_open=2)
+        indices = [(f, z) for _ in range(10) for f in range(2)
+                   for z in range(3)]
+        pool = ThreadPool(4)
+        planes = pool.map(lambda index: img[index], indices)
+        pool.close()
+        pool.join()
+        for (f, z), plane in zip(indices, planes):
+            self.assertTrue(np.array_equal(plane, self.image[f, z]))
+        # Files are closed once they are not read anymore:
+        self.assertLessEqual(len(img._open), 2)
+        self.assertEqual(img._readers, {})
+        img.close()
+
+    def test_file_with_magic_name(self):
+        path = self.write("img[1].tif", self.image)
+        self.assertFalse(is_series(path))
+        self.assertTrue(np.array_equal(open_stack(path)[:, :], self.image))
+
+    def test_series_incomplete(self):
+        self.write("t0z0.tif", self.image[0, 0])
+        self.write("t0z1.tif", self.image[0, 1])
+        self.write("t1z0.tif", self.image[1, 0])
+        self.assertRaises(ValueError, series_files, self.folder)
+
+
+if __name__ == '__main__':
+    unittest.main()
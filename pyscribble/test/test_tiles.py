@@ -0,0 +1,67 @@
+import unittest
+import numpy as np
+
+from ..tiles import TilePyramid
+from ..tiles import aligned_buffer
+from ..tiles import is_aligned
+from ..tiles import reuse_buffer
+
+
+class TestTiles(unittest.TestCase):
+
+    def setUp(self):
+        self.plane = np.arange(1000*700, dtype=np.uint32).reshape(1000, 700)
+        self.pyramid = TilePyramid(self.plane, tile_size=256)
+
+    def test_aligned_buffer(self):
+        buf = aligned_buffer((3, 5))
+        self.assertEqual(buf.shape, (3, 5))
+        self.assertEqual(buf.strides[0], 8)
+        self.assertEqual(buf.base.shape, (3, 8))
+
+    def test_reuse_buffer(self):
+        buf = reuse_buffer(None, (3, 5))
+        self.assertTrue(is_aligned(buf))
+        self.assertIs(reuse_buffer(buf, (3, 5)), buf)
+        self.assertIsNot(reuse_buffer(buf, (3, 6)), buf)
+        self.assertEqual(reuse_buffer(buf, (3, 5), np.uint32).dtype,
+                         np.uint32)
+        self.assertFalse(is_aligned(np.zeros((3, 5), np.uint8)))
+
+    def test_full_resolution_tiles_are_views(self):
+        tile = self.pyramid.tile(0, 1, 2)
+        self.assertTrue(np.shares_memory(tile, self.plane))
+        self.assertFalse(np.shares_memory(self.pyramid.tile(1, 0, 0),
+                                          self.plane))
+
+    def test_levels(self):
+        self.assertEqual(self.pyramid.nlevels, 3)
+        self.assertEqual(self.pyramid.level(8), 0)
+        self.assertEqual(self.pyramid.level(0.5), 1)
+        self.assertEqual(self.pyramid.level(0.3), 1)
+        self.assertEqual(self.pyramid.level(0.01), 2)
+
+    def test_visible_tiles(self):
+        self.assertEqual(self.pyramid.visible_tiles(0, 0, 0, 100, 100),
+                         [(0, 0)])
+        self.assertEqual(self.pyramid.visible_tiles(0, 250, 600, 300, 2000),
+                         [(0, 2), (1, 2)])
+        self.assertEqual(len(self.pyramid.visible_tiles(0, 0, 0, 1000, 700)),
+                         4*3)
+        self.assertEqual(self.pyramid.visible_tiles(2, 0, 0, 1000, 700),
+                         [(0, 0)])
+
+    def test_tiles_cover_plane(self):
+        for level in range(self.pyramid.nlevels):
+            step = 2**level
+            res = np.zeros_like(self.plane[::step, ::step])
+            for ty, tx in self.pyramid.visible_tiles(level, 0, 0, 1000, 700):
+                y0, x0, y1, x1 = self.pyramid.tile_rect(level, ty, tx)
+                tile = self.pyramid.tile(level, ty, tx)
+                res[y0 // step:y0 // step + tile.shape[0],
+                    x0 // step:x0 // step + tile.shape[1]] = tile
+            self.assertTrue(np.array_equal(res, self.plane[::step, ::step]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""Multi-resolution tiling of image planes for display.
+
+Level k of the pyramid of a plane takes every 2**k-th pixel of the plane
+(nearest neighbour) and is split into tiles of fixed size, so only the tiles
+covering the visible part of the plane at the needed resolution have to be
+converted for display. Tiles of full resolution of an aligned plane (see
+aligned_buffer) are views of the plane, nothing is copied.
+
+"""
+
+import math
+import numpy as np
+
+# Size of a tile (pixels of a level):
+TILE_SIZE = 512
+
+
+def aligned_buffer(shape, dtype=np.uint8, align=4):
+    """Allocate a 2D array whose rows start at multiples of `align` bytes.
+
+    Returns a view of shape `shape`; its base holds the padded rows. Qt needs
+    32 bit aligned scanlines to wrap data into a QImage.
+
+    """
+    h, w = shape
+    itemsize = np.dtype(dtype).itemsize
+    stride = -(-w*itemsize // align) * align // itemsize
+    return np.empty((h, stride), dtype)[:, :w]
+
+
+def is_aligned(array, align=4):
+    """Whether rows of a 2D array are contiguous and start at multiples of
+    `align` bytes (can be wrapped into a QImage)."""
+    return (array.strides[1] == array.itemsize and
+            array.strides[0] % align == 0 and
+            array.ctypes.data % align == 0)
+
+
+def reuse_buffer(buffer, shape, dtype=np.uint8):
+    """Return an aligned buffer of a shape and dtype, `buffer` if it fits.
+
+    buffer: buffer to reuse (None to allocate one).
+
+    """
+    if (buffer is None or buffer.shape != tuple(shape) or
+            buffer.dtype != np.dtype(dtype)):
+        buffer = aligned_buffer(shape, dtype)
+    return buffer
+
+
+class TilePyramid(object):
+    """Tiles of a 2D plane at resolutions 1, 1/2, 1/4, ..."""
+
+    def __init__(self, plane, tile_size=TILE_SIZE):
+        self.plane = plane
+        self.tile_size = tile_size
+        h, w = plane.shape
+        # Coarsest level fits into a single tile:
+        self.nlevels = 1 + max(0, int(math.ceil(
+            math.log(float(max(h, w)) / tile_size, 2))))
+
+    def level(self, scale):
+        """Return the coarsest level that keeps full resolution at a scale."""
+        if scale >= 1:
+            return 0
+        level = int(math.floor(math.log(1./scale, 2)))
+        return min(level, self.nlevels - 1)
+
+    def tile_rect(self, level, ty, tx):
+        """Return region (y0, x0, y1, x1) of the plane covered by a tile."""
+        h, w = self.plane.shape
+        size = self.tile_size * 2**level
+        return (ty*size, tx*size,
+                min((ty + 1)*size, h), min((tx + 1)*size, w))
+
+    def visible_tiles(self, level, y0, x0, y1, x1):
+        """Return tiles (ty, tx) of a level intersecting a region of a plane.
+        """
+        h, w = self.plane.shape
+        size = self.tile_size * 2**level
+        ty0, tx0 = max(int(y0 // size), 0), max(int(x0 // size), 0)
+        ty1 = min(int(math.ceil(float(y1) / size)), -(-h // size))
+        tx1 = min(int(math.ceil(float(x1) / size)), -(-w // size))
+        return [(ty, tx) for ty in range(ty0, ty1) for tx in range(tx0, tx1)]
+
+    def tile(self, level, ty, tx):
+        """Return pixels of a tile in an aligned buffer (see aligned_buffer).
+
+        Tiles of level 0 of an aligned plane are views of the plane.
+
+        """
+        y0, x0, y1, x1 = self.tile_rect(level, ty, tx)
+        step = 2**level
+        data = self.plane[y0:y1:step, x0:x1:step]
+        if step == 1 and is_aligned(data):
+            return data
+        out = aligned_buffer(data.shape, data.dtype)
+        out[...] = data
+        return out